@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# # -*- coding: utf-8 -*-
+
+"""
+drop-in replacement of alert_script.sh for the Zabbix media type.
+
+Called by Zabbix with the same three parameters (endpoint, subject, message), taken as
+they are and never as options, it only appends the alert as a json line to a local
+spool file and exits, no process is forked and no network call is made so the alerter
+is never blocked. Many instances can run at the same time, appends are serialized with
+an exclusive lock.
+
+The same script started with --flush sends the spooled alerts to their endpoints in
+batches (json arrays understood by notification_receiver.py) over a persistent http
+connection, with --loop it keeps flushing every --interval seconds.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import argparse
+
+DEFAULT_SPOOL = '/tmp/zabbix_alerts.spool'
+
+
+def open_locked(path):
+
+    """
+    open the spool for appending and lock it, if the flusher renamed the file
+    while we were waiting for the lock open the new one
+    """
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd
+        except OSError:
+            pass
+        os.close(fd)
+
+
+def forward(spool, endpoint, subject, message):
+    line = json.dumps({'endpoint': endpoint, 'subject': subject, 'message': message}) + '\n'
+    fd = open_locked(spool)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def take_spool(spool):
+
+    """
+    atomically move the current spool aside and return its new path, or None
+    if there is nothing to send
+    """
+    if not os.path.exists(spool) or os.path.getsize(spool) == 0:
+        return None
+    fd = open_locked(spool)
+    try:
+        stamp = int(time.time() * 1000)
+        # rename would replace a file taken in the same millisecond, only the flusher takes files
+        while os.path.exists('{}.{}.sending'.format(spool, stamp)):
+            stamp += 1
+        sending = '{}.{}.sending'.format(spool, stamp)
+        os.rename(spool, sending)
+    finally:
+        os.close(fd)
+    return sending
+
+
+def flush(session, spool, batch_size=500, timeout=7):
+
+    """
+    send every spooled alert and return (sent, undelivered). Files left over by a
+    failed flush are retried first. An endpoint that fails does not stop the others
+    nor the next files: once a file is done it is removed, or rewritten with only
+    the alerts of the failed endpoints so the delivered ones are not posted again.
+    Delivery is at least once
+    """
+    directory = os.path.dirname(os.path.abspath(spool))
+    prefix = os.path.basename(spool) + '.'
+    take_spool(spool)
+    pending = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                     if name.startswith(prefix) and name.endswith('.sending'))
+
+    sent = 0
+    undelivered = 0
+    for path in pending:
+        batches = {}
+        with open(path) as sending:
+            for line in sending:
+                try:
+                    alert = json.loads(line)
+                except ValueError:
+                    continue
+                endpoint = alert.pop('endpoint')
+                batches.setdefault(endpoint, []).append(alert)
+
+        remaining = []
+        for endpoint, alerts in batches.items():
+            for start in range(0, len(alerts), batch_size):
+                batch = alerts[start:start + batch_size]
+                try:
+                    response = session.post('http://' + endpoint, data=json.dumps(batch),
+                                            headers={'Content-Type': 'application/json'}, timeout=timeout)
+                    response.raise_for_status()
+                except Exception as ex:
+                    print("\033[91m[ERROR]: {}: {}\033[0m".format(endpoint, ex))
+                    remaining.extend(dict(alert, endpoint=endpoint) for alert in alerts[start:])
+                    break
+                sent += len(batch)
+
+        if not remaining:
+            os.unlink(path)
+            continue
+        # replace the file in one step, a crash leaves either version
+        with open(path + '.tmp', 'w') as rewritten:
+            for alert in remaining:
+                rewritten.write(json.dumps(alert) + '\n')
+        os.rename(path + '.tmp', path)
+        undelivered += len(remaining)
+    return sent, undelivered
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and not sys.argv[1].startswith('-'):
+        # called by the media type: endpoint, subject and message are taken as they are,
+        # an alert text like "-h" or "--flush" must never be read as an option
+        if len(sys.argv) != 4:
+            print("\033[91m[ERROR]: endpoint, subject and message are required\033[0m")
+            sys.exit(2)
+        forward(DEFAULT_SPOOL, *sys.argv[1:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Spool Zabbix alerts and forward them in batches")
+    parser.add_argument("alert", nargs='*', help="endpoint subject message, as passed by the media type")
+    parser.add_argument("--spool", type=str, default=DEFAULT_SPOOL, help="spool file")
+    parser.add_argument("--flush", action="store_true", help="send the spooled alerts")
+    parser.add_argument("--loop", action="store_true", help="with --flush keep flushing every INTERVAL seconds")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between two flushes")
+    parser.add_argument("--batch-size", type=int, default=500, dest='batchsize',
+                        help="alerts sent in a single request")
+    args = parser.parse_args()
+
+    if not args.flush:
+        if len(args.alert) != 3:
+            parser.error('endpoint, subject and message are required')
+        forward(args.spool, *args.alert)
+        sys.exit(0)
+
+    # only the flusher needs requests, the forwarding path stays light
+    import requests
+
+    http_session = requests.Session()
+    while True:
+        try:
+            flushed, undelivered = flush(http_session, args.spool, batch_size=args.batchsize)
+            if flushed:
+                print('sent {} alerts'.format(flushed))
+            if undelivered and not args.loop:
+                sys.exit(1)
+        except Exception as ex:
+            print("\033[91m[ERROR]: {}\033[0m".format(ex))
+            if not args.loop:
+                sys.exit(1)
+        if not args.loop:
+            break
+        time.sleep(args.interval)
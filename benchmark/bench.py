@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# # -*- coding: utf-8 -*-
+
+"""
+benchmark ZabbixAutomation against the local mock_zabbix.py server.
+
+Every scenario runs in its own interpreter so the peak memory reported (max resident
+set size) belongs to that scenario only. For each one wall time, api calls, records
+produced, throughput and peak memory are saved to a json file, pass a previous result
+file with --compare to print the relative change.
+
+    ./bench.py --hosts 10000 --items 500000 --problems 20000 --latency 0.005 -o result.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'mooncloud_zabbix'))
+
+SCENARIOS = ['host_get', 'host_iter', 'item_get', 'item_iter', 'metrics_get', 'metrics_stream',
+             'problem_get', 'event_watch', 'add_item', 'item_create', 'trend_rollup', 'sender']
+
+HOST_BASE = 10000
+
+BENCH_ITEMS = [{'key': 'bench.memory', 'delay': '60s', 'type': 0, 'value_type': 0, 'description': 'memory'},
+               {'key': 'bench.cpu', 'delay': '60s', 'type': 0, 'value_type': 0, 'description': 'cpu'},
+               {'key': 'bench.telnet', 'delay': '60s', 'type': 0, 'value_type': 0, 'description': 'telnet'}]
+
+
+def count(result):
+    if result is False or result is None:
+        return 0
+    if isinstance(result, dict) and 'items' in result:
+        return len(result['items'])
+    return len(result)
+
+
+def run_scenario(name, url, max_workers, chunk_size, page_size):
+
+    """
+    executed in the child interpreter, return the measures of a single scenario
+    """
+    from zabbixautomation import ZabbixAutomation
+    from zabbixstats import ApiStats
+    from zabbixcursor import EventCursor
+    from zabbixsender import ZabbixSender
+
+    stats = ApiStats()
+    session = ZabbixAutomation(url=url, automation_prefix='bench', max_workers=max_workers, stats=stats)
+    session.login(username='bench', password='bench')
+
+    if name == 'event_watch':
+        # a poll 1000 events after the previous one, whatever the open problems (never saved)
+        cursor = EventCursor(os.path.join(HERE, 'event_watch.cursor'))
+        list(session.event_watch(cursor))
+        cursor.eventid -= 1000
+    elif name == 'sender':
+        trapper, port = start_trapper()
+
+    started = time.time()
+    if name == 'host_get':
+        records = count(session.host_get(host_output=['name', 'available']))
+    elif name == 'host_iter':
+        records = sum(1 for host in session.host_iter(host_output=['name', 'available'], page_size=page_size))
+    elif name == 'item_get':
+        records = count(session.item_get(output='extend'))
+    elif name == 'item_iter':
+        records = sum(1 for item in session.item_iter(output='extend', page_size=page_size))
+    elif name == 'metrics_get':
+        records = count(session.metrics_get(chunk_size=chunk_size))
+    elif name == 'metrics_stream':
+        records = sum(1 for metric in session.metrics_stream(chunk_size=chunk_size))
+    elif name == 'problem_get':
+        records = count(session.problem_get(chunk_size=chunk_size))
+    elif name == 'event_watch':
+        records = sum(1 for event in session.event_watch(cursor, page_size=page_size))
+    elif name == 'trend_rollup':
+        # a week of hourly trends per item, rolled up per host and day
+        now = int(time.time())
+        records = sum(1 for row in session.trend_rollup(now - 7 * 86400, now, group_by='host', bucket=86400,
+                                                        chunk_size=chunk_size))
+    elif name == 'sender':
+        # 100k values pushed page_size per frame to the trapper stand-in
+        sender = ZabbixSender('127.0.0.1', port, batch_size=page_size)
+        records = sender.send(('host{}'.format(index % 1000), 'bench.cpu', index * 0.5)
+                              for index in xrange(100000))['processed']
+        sender.close()
+        trapper.terminate()
+    elif name == 'item_create':
+        # one item per host through the batched lookups of item_create, run it with
+        # --session-calls to have the session expire in the middle of the batches
+        records = 0
+        for host in xrange(100):
+            created = session.item_create('bench.check', '60s', 0, 0, 'check', HOST_BASE + host)
+            if not created:
+                raise ValueError('item_create failed on host {}'.format(HOST_BASE + host))
+            records += len(created['items'])
+    elif name == 'add_item':
+        records = sum(len(host['itemids']) for host in
+                      session.item_bulk_create(BENCH_ITEMS, chunk_size=chunk_size).values())
+    else:
+        raise ValueError('unknown scenario {}'.format(name))
+    wall = time.time() - started
+
+    session.logout()
+    session.close()
+    calls = stats.to_dict()
+    return {'scenario': name,
+            'wall_seconds': wall,
+            'records': records,
+            'records_per_second': records / wall if wall else 0.0,
+            'api_calls': sum(method['calls'] for method in calls.values()),
+            'api_errors': sum(method['errors'] for method in calls.values()),
+            'response_bytes': sum(method['response_bytes'] for method in calls.values()),
+            # kilobytes on linux
+            'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'calls_by_method': dict((method, values['calls']) for method, values in calls.items())}
+
+
+def free_port():
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+def start_server(args):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, 'mock_zabbix.py'),
+                               '--port', str(port),
+                               '--hosts', str(args.hosts),
+                               '--items', str(args.items),
+                               '--problems', str(args.problems),
+                               '--latency', str(args.latency),
+                               '--jitter', str(args.jitter),
+                               '--session-calls', str(args.sessioncalls)],
+                              stdout=subprocess.PIPE)
+    # the server prints a line once it is listening
+    server.stdout.readline()
+    return server, 'http://127.0.0.1:{}/'.format(port)
+
+
+def start_trapper():
+    port = free_port()
+    trapper = subprocess.Popen([sys.executable, os.path.join(HERE, 'mock_trapper.py'), '--port', str(port)],
+                               stdout=subprocess.PIPE)
+    trapper.stdout.readline()
+    return trapper, port
+
+
+def compare(results, previous_path):
+    with open(previous_path) as previous_file:
+        previous = dict((result['scenario'], result) for result in json.load(previous_file)['results'])
+    for result in results:
+        old = previous.get(result['scenario'])
+        if old is None:
+            continue
+        changes = []
+        for key in ('wall_seconds', 'api_calls', 'peak_memory_kb'):
+            if old[key]:
+                changes.append('{} {:+.1f}%'.format(key, (result[key] - old[key]) * 100.0 / old[key]))
+        print('{:<16} {}'.format(result['scenario'], '  '.join(changes)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ZabbixAutomation against a mock Zabbix server")
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--problems", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added by the server to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="max random seconds added to the latency")
+    parser.add_argument("--session-calls", type=int, default=0, dest='sessioncalls',
+                        help="make the server expire every session after this many calls")
+    parser.add_argument("--max-workers", type=int, default=4, dest='maxworkers')
+    parser.add_argument("--chunk-size", type=int, default=500, dest='chunksize')
+    parser.add_argument("--page-size", type=int, default=1000, dest='pagesize')
+    parser.add_argument("-s", "--scenario", action='append', choices=SCENARIOS,
+                        help="scenario to run, repeat it to run several (default all)")
+    parser.add_argument("-o", "--output", type=str, default='bench_result.json', help="result file")
+    parser.add_argument("--compare", type=str, help="previous result file to compare with")
+    parser.add_argument("--run-scenario", type=str, dest='runscenario', help=argparse.SUPPRESS)
+    parser.add_argument("--url", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.runscenario:
+        print(json.dumps(run_scenario(args.runscenario, args.url, args.maxworkers, args.chunksize, args.pagesize)))
+        return
+
+    server, url = start_server(args)
+    results = []
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                              '--run-scenario', scenario, '--url', url,
+                                              '--max-workers', str(args.maxworkers),
+                                              '--chunk-size', str(args.chunksize),
+                                              '--page-size', str(args.pagesize)])
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print('{scenario:<16} {wall_seconds:8.3f}s {records:>9} records {records_per_second:>11.1f}/s '
+                  '{api_calls:>6} calls {peak_memory_kb:>9} KB'.format(**result))
+    finally:
+        server.terminate()
+
+    with open(args.output, 'w') as output_file:
+        json.dump({'timestamp': int(time.time()),
+                   'fleet': {'hosts': args.hosts, 'items': args.items, 'problems': args.problems},
+                   'latency': args.latency,
+                   'jitter': args.jitter,
+                   'max_workers': args.maxworkers,
+                   'chunk_size': args.chunksize,
+                   'page_size': args.pagesize,
+                   'results': results}, output_file, indent=2, sort_keys=True)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# # -*- coding: utf-8 -*-
+
+"""
+stand-in for the trapper port of a Zabbix server, used to test and benchmark
+ZabbixSender. It speaks the ZBXD protocol (plain or compressed frames) and answers
+'sender data' requests like the server does: values of the hosts of the mock fleet
+(host0 .. hostN-1) are processed, the others failed. Like the real server it closes
+the connection after every answer unless --keep-alive is given
+"""
+
+import sys
+import json
+import zlib
+import struct
+import argparse
+from SocketServer import ThreadingMixIn, TCPServer, StreamRequestHandler
+
+HEADER = struct.Struct('<4sBII')
+
+
+class Handler(StreamRequestHandler):
+    hosts = 1000
+    keep_alive = False
+
+    def frame(self, answer):
+        data = json.dumps(answer)
+        return HEADER.pack('ZBXD', 0x01, len(data), 0) + data
+
+    def known(self, host):
+        return host.startswith('host') and host[4:].isdigit() and int(host[4:]) < self.hosts
+
+    def handle(self):
+        while True:
+            header = self.rfile.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            signature, flags, length, uncompressed = HEADER.unpack(header)
+            if signature != 'ZBXD':
+                return
+            data = self.rfile.read(length)
+            if flags & 0x02:
+                data = zlib.decompress(data)
+            request = json.loads(data)
+            if request.get('request') != 'sender data':
+                answer = {'response': 'failed', 'info': 'unsupported request'}
+            else:
+                values = request.get('data', [])
+                processed = sum(1 for value in values if self.known(value.get('host', '')))
+                answer = {'response': 'success',
+                          'info': 'processed: {}; failed: {}; total: {}; seconds spent: 0.000100'
+                                  .format(processed, len(values) - processed, len(values))}
+            self.wfile.write(self.frame(answer))
+            self.wfile.flush()
+            if not self.keep_alive:
+                return
+
+
+class ThreadedTCPServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(port, hosts, keep_alive=False):
+    Handler.hosts = hosts
+    Handler.keep_alive = keep_alive
+    server = ThreadedTCPServer(('127.0.0.1', port), Handler)
+    print('mock trapper listening on 127.0.0.1:{}'.format(server.server_address[1]))
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Zabbix trapper accepting sender data")
+    parser.add_argument("--port", type=int, default=10051)
+    parser.add_argument("--hosts", type=int, default=10000, help="host0 .. hostN-1 are known hosts")
+    parser.add_argument("--keep-alive", action="store_true", dest='keepalive',
+                        help="keep the connection open after an answer")
+    args = parser.parse_args()
+
+    serve(args.port, args.hosts, args.keepalive)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# # -*- coding: utf-8 -*-
+
+"""
+stand-in for the Zabbix api_jsonrpc.php used by the benchmarks. It serves a synthetic
+fleet computed on the fly from the object indexes (nothing is kept in memory, so 500k
+items cost nothing until asked for) and can add a fixed plus random latency to every
+request to simulate a remote frontend. Single calls and json-rpc batches are supported
+for the methods used by ZabbixAutomation
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+HOST_BASE = 10000
+INTERFACE_BASE = 50000
+ITEM_BASE = 1000000
+EVENT_BASE = 5000000
+ITEMID_BASE = 100000000
+
+
+class SessionExpired(Exception):
+    pass
+
+
+class Fleet(object):
+    def __init__(self, hosts, items, problems, now=None, session_calls=0):
+        self.hosts = hosts
+        self.items = items
+        self.problems = problems
+        self.items_per_host = max(1, items // max(1, hosts))
+        self.now = int(now or time.time())
+        self.created = 0
+        # (hostid, key_) of the created items, keys are unique per host like on the server
+        self.created_keys = set()
+        # every session expires after session_calls authenticated calls, 0 never
+        self.session_calls = session_calls
+        self.sessions = 0
+        self.session_uses = 0
+        self.lock = threading.Lock()
+
+    # helpers
+
+    @staticmethod
+    def ids(value):
+        if value is None:
+            return None
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        return [int(element) for element in value]
+
+    @staticmethod
+    def project(record, output, pk):
+        if output is None or output == 'extend':
+            return record
+        if isinstance(output, basestring):
+            output = [output]
+        projected = dict((field, record[field]) for field in output if field in record)
+        projected[pk] = record[pk]
+        return projected
+
+    @staticmethod
+    def limit(records, params):
+        if params.get('sortorder') == 'DESC':
+            records = list(records)[::-1]
+        if params.get('limit'):
+            return list(records)[:int(params['limit'])]
+        return list(records)
+
+    # objects
+
+    def host(self, index):
+        return {'hostid': str(HOST_BASE + index),
+                'host': 'host{}'.format(index),
+                'name': 'host{}'.format(index),
+                'available': '1' if index % 50 else '2',
+                'status': '0'}
+
+    def item(self, index):
+        host = index // self.items_per_host
+        return {'itemid': str(ITEM_BASE + index),
+                'hostid': str(HOST_BASE + min(host, self.hosts - 1)),
+                'name': 'item {}'.format(index),
+                'key_': 'bench.key[{}]'.format(index),
+                'description': '',
+                'type': '0',
+                'value_type': '0',
+                'delay': '60s',
+                'state': '0',
+                'lastvalue': str(index % 1000 / 10.0),
+                'lastclock': str(self.now - index % 60),
+                'prevvalue': '0'}
+
+    def host_indexes(self, params):
+        host_filter = params.get('filter')
+        hostids = self.ids(params.get('hostids'))
+        if hostids is None and isinstance(host_filter, dict):
+            hostids = self.ids(host_filter.get('hostid'))
+        if hostids is None:
+            indexes = xrange(self.hosts)
+        else:
+            indexes = sorted(hostid - HOST_BASE for hostid in hostids if 0 <= hostid - HOST_BASE < self.hosts)
+        available = host_filter.get('available') if isinstance(host_filter, dict) else None
+        if available is not None:
+            indexes = (index for index in indexes if self.host(index)['available'] == str(available))
+        return indexes
+
+    def item_indexes(self, params):
+        itemids = self.ids(params.get('itemids'))
+        if itemids is not None:
+            return sorted(itemid - ITEM_BASE for itemid in itemids if 0 <= itemid - ITEM_BASE < self.items)
+        hostids = self.ids(params.get('hostids'))
+        if hostids is None:
+            return xrange(self.items)
+        indexes = []
+        for hostid in sorted(hostids):
+            host = hostid - HOST_BASE
+            if not 0 <= host < self.hosts:
+                continue
+            last = self.items if host == self.hosts - 1 else (host + 1) * self.items_per_host
+            indexes.extend(xrange(host * self.items_per_host, min(last, self.items)))
+        return indexes
+
+    # api methods
+
+    def authorize(self, method, auth):
+        if not self.session_calls or method in ('user.login', 'apiinfo.version'):
+            return
+        with self.lock:
+            if auth != 'benchmarktoken{}'.format(self.sessions) or self.session_uses >= self.session_calls:
+                raise SessionExpired()
+            self.session_uses += 1
+
+    def call(self, method, params):
+        handler = getattr(self, method.replace('.', '_'), None)
+        if handler is None:
+            raise ValueError('Incorrect method "{}".'.format(method))
+        return handler(params if isinstance(params, (dict, list)) else {})
+
+    def user_login(self, params):
+        with self.lock:
+            self.sessions += 1
+            self.session_uses = 0
+            return 'benchmarktoken{}'.format(self.sessions)
+
+    def user_logout(self, params):
+        return True
+
+    def user_get(self, params):
+        return [{'userid': '1'}]
+
+    def apiinfo_version(self, params):
+        return '3.4.15'
+
+    def host_get(self, params):
+        hosts = []
+        for index in self.host_indexes(params):
+            host = self.project(self.host(index), params.get('output'), 'hostid')
+            if params.get('selectGroups'):
+                host['groups'] = [{'groupid': str(index % 10), 'name': 'group{}'.format(index % 10)}]
+            hosts.append(host)
+        return self.limit(hosts, params)
+
+    def hostinterface_get(self, params):
+        return [self.project({'interfaceid': str(INTERFACE_BASE + index),
+                              'hostid': str(HOST_BASE + index),
+                              'main': '1', 'type': '1', 'ip': '127.0.0.1', 'port': '10050'},
+                             params.get('output'), 'interfaceid')
+                for index in self.host_indexes(params)]
+
+    def item_get(self, params):
+        records = []
+        for index in self.item_indexes(params):
+            item = self.item(index)
+            record = self.project(item, params.get('output'), 'itemid')
+            if params.get('selectHosts'):
+                record['hosts'] = [{'hostid': item['hostid'], 'name': self.host(int(item['hostid']) - HOST_BASE)['name']}]
+            records.append(record)
+        return self.limit(records, params)
+
+    def item_create(self, params):
+        items = params if isinstance(params, list) else [params]
+        with self.lock:
+            keys = [(str(item.get('hostid')), item.get('key_')) for item in items]
+            for hostid, key in keys:
+                # the whole request is refused, nothing is created
+                if (hostid, key) in self.created_keys or keys.count((hostid, key)) > 1:
+                    raise ValueError('Item with key "{}" already exists on host {}.'.format(key, hostid))
+            self.created_keys.update(keys)
+            first = self.created
+            self.created += len(items)
+        return {'itemids': [str(ITEMID_BASE + first + offset) for offset in range(len(items))]}
+
+    def problem_get(self, params):
+        return self.limit(({'eventid': str(EVENT_BASE + index), 'clock': str(self.now - index)}
+                           for index in xrange(self.problems)), params)
+
+    def event_get(self, params):
+        eventids = self.ids(params.get('eventids'))
+        if eventids is None:
+            eventids = self.ids((params.get('filter') or {}).get('eventid'))
+        if eventids is None:
+            # every problem event in id order, from eventid_from on
+            first = max(0, int(params.get('eventid_from') or EVENT_BASE) - EVENT_BASE)
+            return self.limit(self.event_get({'eventids': range(EVENT_BASE + first, EVENT_BASE + self.problems)}),
+                              params)
+        events = []
+        for eventid in eventids:
+            index = eventid - EVENT_BASE
+            if not 0 <= index < self.problems:
+                continue
+            host = self.host(index % self.hosts)
+            events.append({'eventid': str(eventid),
+                           'value': '1',
+                           'objectid': str(index),
+                           'acknowledged': '0',
+                           'clock': str(self.now - index),
+                           'hosts': [{'hostid': host['hostid'], 'host': host['host']}],
+                           'relatedObject': {'triggerid': str(index), 'description': 'problem {}'.format(index),
+                                             'priority': str(index % 6)}})
+        return events
+
+    def history_get(self, params):
+        values = []
+        step = 60
+        time_from = int(params.get('time_from', self.now - 3600))
+        time_till = int(params.get('time_till', self.now))
+        for itemid in self.ids(params.get('itemids')) or []:
+            for clock in xrange(time_from + (-time_from) % step, time_till + 1, step):
+                values.append({'itemid': str(itemid), 'clock': str(clock), 'value': str(clock % 100), 'ns': '0'})
+        values.sort(key=lambda value: int(value['clock']))
+        return values
+
+    def trend_get(self, params):
+        trends = []
+        step = 3600
+        time_from = int(params.get('time_from', self.now - 86400))
+        time_till = int(params.get('time_till', self.now))
+        for itemid in self.ids(params.get('itemids')) or []:
+            for clock in xrange(time_from + (-time_from) % step, time_till + 1, step):
+                base = (itemid + clock // step) % 100
+                trends.append({'itemid': str(itemid), 'clock': str(clock), 'num': '60',
+                               'value_min': str(base), 'value_avg': str(base + 0.5), 'value_max': str(base + 1)})
+        return trends
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body leave in one segment, small answers are not held by nagle
+    wbufsize = -1
+    fleet = None
+    latency = 0.0
+    jitter = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def answer(self, request):
+        try:
+            self.fleet.authorize(request.get('method', ''), request.get('auth'))
+            result = self.fleet.call(request.get('method', ''), request.get('params'))
+            return {'jsonrpc': '2.0', 'result': result, 'id': request.get('id')}
+        except SessionExpired:
+            return {'jsonrpc': '2.0', 'id': request.get('id'),
+                    'error': {'code': -32602, 'message': 'Invalid params.',
+                              'data': 'Session terminated, re-login, please.'}}
+        except ValueError as ex:
+            return {'jsonrpc': '2.0', 'id': request.get('id'),
+                    'error': {'code': -32602, 'message': 'Invalid params.', 'data': str(ex)}}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if isinstance(body, list):
+            answer = [self.answer(request) for request in body]
+        else:
+            answer = self.answer(body)
+        data = json.dumps(answer)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.wfile.flush()
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(port, fleet, latency=0.0, jitter=0.0):
+    Handler.fleet = fleet
+    Handler.latency = latency
+    Handler.jitter = jitter
+    httpd = ThreadedHTTPServer(('127.0.0.1', port), Handler)
+    print('mock zabbix listening on 127.0.0.1:{}'.format(httpd.server_address[1]))
+    sys.stdout.flush()
+    httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Zabbix JSON-RPC server with a synthetic fleet")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--hosts", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=500000)
+    parser.add_argument("--problems", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="max random seconds added to the latency")
+    parser.add_argument("--session-calls", type=int, default=0, dest='sessioncalls',
+                        help="expire every session after this many authenticated calls (0 never)")
+    args = parser.parse_args()
+
+    serve(args.port, Fleet(args.hosts, args.items, args.problems, session_calls=args.sessioncalls), args.latency,
+          args.jitter)
@@ -1,4 +1,6 @@
+import os
 import json
+import threading
 from future.utils import raise_from
 
 
@@ -14,13 +16,181 @@ class Config(object):
             raise_from(IOError('failed to open {}'.format(config_file)), exc)
 
 
+class ReadOnlyDict(dict):
+    """
+    dict refusing any modification, used for the parsed configuration
+    which is shared by every caller of Parameter.get
+    """
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('configuration is read only')
+
+    __setitem__ = __delitem__ = update = pop = popitem = setdefault = clear = _read_only
+
+
 class Parameter(Config):
+    """
+    the configuration is parsed and validated once, then served from an immutable
+    in-memory view. Every get only compares the file mtime with the one parsed and
+    reloads when it changed, a file that became invalid is reported and the last
+    valid configuration is kept
+    """
+
+    # section -> required keys and their accepted types
+    SCHEMA = {
+        'zabbix_credentials': {
+            'zabbix_username': basestring,
+            'zabbix_password': basestring,
+            'zabbix_url': basestring,
+        },
+        'zabbix_api_settings': {
+            'system_prefix': basestring,
+            'system_probe_wait': (int, float),
+            'enable_debug': bool,
+            'notification_script': basestring,
+            'action_template': basestring,
+            'notification_endpoint': basestring,
+        },
+    }
+
+    # optional settings checked only when present
+    OPTIONAL_SETTINGS = {
+        'json-rpc': basestring,
+        'content_type': basestring,
+        'use_invalid_cert': bool,
+        'timeout': (int, float),
+        'system_probe_jitter': (int, float),
+        'pool_size': int,
+        'keep_alive': bool,
+        'compression': bool,
+        'chunk_size': int,
+        'max_workers': int,
+        'page_size': int,
+        'cache': dict,
+        'token_cache': basestring,
+        'token_cache_max_age': (int, float),
+        'notification_max_sessions': int,
+        'json_backend': basestring,
+        'fanout_timeout': (int, float),
+        'retries': int,
+        'retry_backoff': (int, float),
+        'concurrency': dict,
+        'circuit_breaker': dict,
+        'metrics_store': basestring,
+        'trapper_server': basestring,
+        'trapper_port': int,
+        'sender_batch_size': int,
+    }
+
+    # entries of the optional zabbix_servers list
+    SERVER_SCHEMA = {
+        'name': basestring,
+        'zabbix_url': basestring,
+        'zabbix_username': basestring,
+        'zabbix_password': basestring,
+    }
+
+    OPTIONAL_SERVER_SETTINGS = {
+        'timeout': (int, float),
+        'query_timeout': (int, float),
+    }
+
+    ITEM_SCHEMA = {
+        'key': basestring,
+        'delay': basestring,
+        'type': int,
+        'value_type': int,
+        'description': basestring,
+    }
+
     def __init__(self, config_file):
         super(Parameter, self).__init__(config_file)
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.conf = None
+        self.reload()
+
+    def reload(self):
+        mtime = os.stat(self.config_file).st_mtime
+        with open(self.config_file) as config:
+            conf = json.load(config)
+        self.validate(conf)
+        self.conf = self.freeze(conf)
+        self.mtime = mtime
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.config_file).st_mtime
+        except OSError:
+            return
+        if mtime == self.mtime:
+            return
+        with self.lock:
+            if mtime == self.mtime:
+                return
+            try:
+                self.reload()
+            except (IOError, ValueError, KeyError, TypeError) as ex:
+                # don't retry until the file changes again
+                self.mtime = mtime
+                print('\033[91m[ERROR]: keeping previous configuration, {}\033[0m'.format(ex))
 
     def get(self, custom_key):
-        conf = json.load(open(self.config_file))
-        for key, value in conf.items():
-            if custom_key == key:
-                return value
-        raise KeyError("{} not found".format(custom_key))
+        self.refresh()
+        try:
+            return self.conf[custom_key]
+        except KeyError:
+            raise KeyError("{} not found".format(custom_key))
+
+    @classmethod
+    def validate(cls, conf):
+        if not isinstance(conf, dict):
+            raise ValueError('configuration must be a json object')
+
+        for section, keys in cls.SCHEMA.items():
+            if not isinstance(conf.get(section), dict):
+                raise ValueError('missing section {}'.format(section))
+            cls.check_types(section, conf[section], keys, required=True)
+
+        cls.check_types('zabbix_api_settings', conf['zabbix_api_settings'], cls.OPTIONAL_SETTINGS, required=False)
+
+        servers = conf.get('zabbix_servers', [])
+        if not isinstance(servers, list):
+            raise ValueError('zabbix_servers must be a list')
+        names = set()
+        for index, server in enumerate(servers):
+            section = 'zabbix_servers[{}]'.format(index)
+            if not isinstance(server, dict):
+                raise ValueError('{} must be an object'.format(section))
+            cls.check_types(section, server, cls.SERVER_SCHEMA, required=True)
+            cls.check_types(section, server, cls.OPTIONAL_SERVER_SETTINGS, required=False)
+            if server['name'] in names:
+                raise ValueError('{}.name {} is not unique'.format(section, server['name']))
+            names.add(server['name'])
+
+        items = conf.get('zabbix_items', {})
+        if not isinstance(items, dict):
+            raise ValueError('zabbix_items must be an object')
+        for name, item in items.items():
+            if not isinstance(item, dict):
+                raise ValueError('zabbix_items.{} must be an object'.format(name))
+            cls.check_types('zabbix_items.' + name, item, cls.ITEM_SCHEMA, required=True)
+
+    @staticmethod
+    def check_types(section, values, keys, required):
+        for key, types in keys.items():
+            if key not in values:
+                if required:
+                    raise ValueError('{}.{} is required'.format(section, key))
+                continue
+            value = values[key]
+            # bool is an int subclass, don't accept true where a number is expected
+            if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+                raise ValueError('{}.{} has an invalid value {!r}'.format(section, key, value))
+
+    @classmethod
+    def freeze(cls, value):
+        if isinstance(value, dict):
+            return ReadOnlyDict((key, cls.freeze(element)) for key, element in value.items())
+        if isinstance(value, list):
+            return tuple(cls.freeze(element) for element in value)
+        return value
@@ -3,9 +3,78 @@
 
 import sys
 import json
+import signal
+import itertools
 import argparse
+from urlparse import urlparse
 from config import Parameter
 from zabbixautomation import ZabbixAutomation
+from zabbixapi_exception import ZabbixApiException
+from zabbixfanout import ZabbixFanout
+from zabbixcache import ZabbixCache
+from zabbixresilience import AdaptiveLimiter, CircuitBreaker
+from zabbixrollup import GROUP_BY, tsdb_lines
+from zabbixstore import MetricsStore
+from zabbixsender import ZabbixSender
+from zabbixcursor import MetricsCursor, EventCursor
+from zabbixpoller import ZabbixPoller
+from zabbixtoken import TokenCache
+from zabbixstats import ApiStats
+
+
+def stream_lines(lines, output=None):
+    out = open(output, 'w') if output else sys.stdout
+    try:
+        for line in lines:
+            out.write(line + '\n')
+    except Exception as ex:
+        ZabbixAutomation.automation_exception(ex.message)
+        return False
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return True
+
+
+def stream_records(records, output=None):
+    return stream_lines((json.dumps(record.to_dict(), sort_keys=True) for record in records), output)
+
+
+def stored_lines(values):
+    for host, key, itemid, clock, value in values:
+        yield u'{}.{} {!r} {}'.format(host, key, value, clock).encode('utf-8')
+
+
+def sender_values(path):
+    # lines of a zabbix_sender input file: host key value
+    source = sys.stdin if path == '-' else open(path)
+    try:
+        for number, line in enumerate(source, 1):
+            fields = line.split(None, 2)
+            if not fields:
+                continue
+            if len(fields) < 3:
+                ZabbixAutomation.automation_exception('{}:{}: expected "host key value"'.format(path, number))
+                continue
+            yield fields[0], fields[1], fields[2].rstrip()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def tagged_lines(tagged):
+    # records get a source field, metric lines the server name as first path element
+    for source, record in tagged:
+        if isinstance(record, basestring):
+            yield '{}.{}'.format(source, record)
+        elif isinstance(record, tuple):
+            # trend rollup rows
+            for line in tsdb_lines([record]):
+                yield '{}.{}'.format(source, line)
+        else:
+            record = record.to_dict()
+            record['source'] = source
+            yield json.dumps(record, sort_keys=True)
 
 
 if __name__ == "__main__":
@@ -29,8 +98,37 @@ if __name__ == "__main__":
                         help="list all problems")
     parser.add_argument("-m", "--metrics", action="store_true",
                         help="list items value as metrics")
+    parser.add_argument("--history", action="store", type=int, nargs=2, metavar=('FROM', 'TILL'),
+                        help="export history values between two unix timestamps")
+    parser.add_argument("--rollup", action="store", type=int, nargs=2, metavar=('FROM', 'TILL'),
+                        help="export min/avg/max of trends between two unix timestamps")
+    parser.add_argument("--group-by", action="store", choices=GROUP_BY, default='item', dest='groupby',
+                        help="aggregate --rollup per item (host.key), host, key or host group")
+    parser.add_argument("--bucket", action="store", type=int, default=3600,
+                        help="seconds covered by every --rollup value")
+    parser.add_argument("--window", action="store", type=int,
+                        help="seconds of history (default 3600) or trends (default 86400) fetched per request")
+    parser.add_argument("--key", action="store", type=str,
+                        help="only export items whose key matches KEY with --history or --rollup, "
+                             "only read the items with key KEY from the metrics_store with --local-*")
+    parser.add_argument("--host", action="store", type=str,
+                        help="only read the items of host HOST from the metrics_store with --local-*")
+    parser.add_argument("--local-range", action="store", type=int, nargs=2, metavar=('FROM', 'TILL'),
+                        dest='localrange',
+                        help="print the values kept in the metrics_store between two unix timestamps, "
+                             "zabbix is not contacted")
+    parser.add_argument("--local-last", action="store", type=int, metavar='N', dest='locallast',
+                        help="print the N most recent values of every item kept in the metrics_store, "
+                             "zabbix is not contacted")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep the session open and collect metrics (-m), problems (-p) and/or events "
+                             "(--watch) every system_probe_wait seconds, no other action is accepted")
     parser.add_argument("--add-item", action="store_true", dest='additem',
                         help="add all items in configuration")
+    parser.add_argument("--trapper", action="store_true",
+                        help="with --add-item create the items as trapper items, whose values are pushed with --send")
+    parser.add_argument("--send", action="store", type=str, metavar='FILE',
+                        help="push the 'host key value' lines of FILE (- for stdin) to the zabbix trapper port")
     parser.add_argument("--del-item", action="store", type=int, dest='delitem',
                         help="delete the item specified as DELITEM")
     parser.add_argument("--add-alert", action="store_true", dest='addalert',
@@ -39,14 +137,52 @@ if __name__ == "__main__":
                         help="remove alert action")
     parser.add_argument("--extend", action="store_true",
                         help="show full output")
+    parser.add_argument("--stream", action="store_true",
+                        help="write results line by line as they arrive")
+    parser.add_argument("--format", action="store", choices=['json', 'ndjson', 'mooncloud'], default='json',
+                        help="json prints the whole result, ndjson writes one record per line as it arrives "
+                             "(hosts, items, interfaces and problems, implies --stream), mooncloud wraps the "
+                             "result in the {data, success} envelope")
+    parser.add_argument("-o", "--output", type=str,
+                        help="write streamed results to OUTPUT instead of stdout")
+    parser.add_argument("--incremental", action="store", type=str, dest='cursor',
+                        help="with -m export only values newer than the ones recorded in the CURSOR file")
+    parser.add_argument("--watch", action="store", type=str, metavar='CURSOR',
+                        help="write the problems opened and resolved since the eventid recorded in the CURSOR "
+                             "file, one json per line (every system_probe_wait seconds with --daemon)")
+    parser.add_argument("--stats", action="store", nargs='?', const='json', choices=['json', 'prometheus'],
+                        help="print per api method call statistics to stderr at exit")
+    parser.add_argument("--servers", action="store", nargs='*', metavar='NAME',
+                        help="run -l, -t, -f, -p, -m, --history or --rollup on the zabbix_servers of the configuration "
+                             "(all of them when no NAME is given) and merge the results line by line")
+    parser.add_argument("--page-size", action="store", type=int, dest='pagesize',
+                        help="records fetched per page when streaming hosts or items, "
+                             "0 sends a single request decoded while it is received")
     args = parser.parse_args()
 
+    if args.daemon:
+        # the daemon only collects, one-shot actions would run once it stops
+        one_shot = [option for option, value in (('-l', args.listhosts), ('-t', args.listitems), ('-f', args.listint),
+                                                 ('--history', args.history), ('--rollup', args.rollup),
+                                                 ('--add-item', args.additem), ('--del-item', args.delitem is not None),
+                                                 ('--add-alert', args.addalert), ('--del-alert', args.delalert),
+                                                 ('--send', args.send), ('--local-range', args.localrange),
+                                                 ('--local-last', args.locallast is not None),
+                                                 ('--servers', args.servers is not None))
+                    if value]
+        if one_shot:
+            parser.error('--daemon only runs -m, -p and --watch, not {}'.format(', '.join(one_shot)))
+
     if not args.verbose:
         sys.tracebacklimit = 0
 
+    if args.format == 'ndjson':
+        args.stream = True
+
     login_success = False
     logout_success = False
     action_specified = False
+    streamed = False
 
     conf = Parameter(args.config)
     credentials = conf.get('zabbix_credentials')
@@ -56,13 +192,130 @@ if __name__ == "__main__":
     settings = conf.get('zabbix_api_settings')
     prefix = settings['system_prefix']
     probe_wait = settings['system_probe_wait']
+    probe_jitter = settings.get('system_probe_jitter', 0)
     debug = settings['enable_debug']
     notification_template = settings['action_template']
     notification_script = settings['notification_script']
     notification_endpoint = settings['notification_endpoint']
+    notification_max_sessions = settings.get('notification_max_sessions', 1)
+    json_rpc = settings.get('json-rpc', '2.0')
+    content_type = settings.get('content_type', 'application/json-rpc')
+    invalid_cert = settings.get('use_invalid_cert', False)
+    timeout = settings.get('timeout', 7)
+    pool_size = settings.get('pool_size', 10)
+    keep_alive = settings.get('keep_alive', True)
+    compression = settings.get('compression', True)
+    chunk_size = settings.get('chunk_size', 500)
+    max_workers = settings.get('max_workers', 1)
+    page_size = args.pagesize if args.pagesize is not None else settings.get('page_size', 1000)
+    json_decoder = settings.get('json_backend', 'json')
+    token_cache = None
+    if settings.get('token_cache'):
+        token_cache = TokenCache(settings['token_cache'], max_age=settings.get('token_cache_max_age'))
+    cache_settings = settings.get('cache', {})
+    cache = None
+    if cache_settings.get('enabled', False):
+        cache = ZabbixCache(size=cache_settings.get('size', 1024), ttl=cache_settings.get('ttl'))
+    concurrency_settings = settings.get('concurrency', {})
+    limiter = None
+    if concurrency_settings.get('enabled', False):
+        limiter = AdaptiveLimiter(initial=concurrency_settings.get('initial', max_workers),
+                                  minimum=concurrency_settings.get('min', 1),
+                                  maximum=concurrency_settings.get('max', max_workers),
+                                  latency_target=concurrency_settings.get('latency_target'))
+    breaker_settings = settings.get('circuit_breaker', {})
+    circuit_breaker = None
+    if breaker_settings.get('enabled', False):
+        circuit_breaker = CircuitBreaker(failures=breaker_settings.get('failures', 5),
+                                         reset_timeout=breaker_settings.get('reset_timeout', 30))
     items = conf.get('zabbix_items')
+    stats = ApiStats() if args.stats else None
+    store = MetricsStore(settings['metrics_store']) if settings.get('metrics_store') else None
+
+    if args.localrange or args.locallast:
+        if store is None:
+            ZabbixAutomation.automation_exception('no metrics_store configured')
+            sys.exit(1)
+        if args.localrange:
+            values = store.range(args.localrange[0], args.localrange[1], host=args.host, key=args.key)
+        else:
+            values = ((store.name(itemid) + (itemid, clock, value))
+                      for itemid, newest in sorted(store.last(args.locallast, host=args.host, key=args.key).items())
+                      for clock, value in newest)
+        sys.exit(0 if stream_lines(stored_lines(values), args.output) else 1)
+
+    api_settings = dict(json_rpc=json_rpc,
+                        content_type=content_type,
+                        invalid_cert=invalid_cert,
+                        timeout=timeout,
+                        enable_debug=debug,
+                        pool_size=pool_size,
+                        keep_alive=keep_alive,
+                        compression=compression,
+                        max_workers=max_workers,
+                        token_cache=token_cache,
+                        stats=stats,
+                        json_decoder=json_decoder,
+                        retries=settings.get('retries', 2),
+                        retry_backoff=settings.get('retry_backoff', 0.5),
+                        limiter=limiter,
+                        circuit_breaker=circuit_breaker)
+
+    if args.servers is not None:
+        try:
+            servers = conf.get('zabbix_servers')
+        except KeyError:
+            servers = ()
+        unknown = set(args.servers) - set(server['name'] for server in servers)
+        if unknown or not servers:
+            ZabbixAutomation.automation_exception('unknown servers {}'.format(', '.join(sorted(unknown)))
+                                                  if unknown else 'no zabbix_servers configured')
+            sys.exit(1)
+        if args.cursor or args.watch:
+            ZabbixAutomation.automation_exception('--incremental and --watch are not supported with --servers')
+            sys.exit(1)
+        if args.servers:
+            servers = [server for server in servers if server['name'] in args.servers]
+
+        fanout = ZabbixFanout(servers, prefix, deadline=settings.get('fanout_timeout'),
+                              cache_settings=cache_settings if cache is not None else None, **api_settings)
+        queries = []
+        if args.listhosts:
+            queries.append(('host_iter', dict(host_output='extend' if args.extend else ['name', 'available'],
+                                              host_id=args.hostid, page_size=page_size)))
+        if args.listitems:
+            queries.append(('item_iter', dict(output='extend' if args.extend else ['description', 'lastvalue'],
+                                              host_id=args.hostid, page_size=page_size)))
+        if args.listint:
+            queries.append(('interface_iter', dict(host_id=args.hostid)))
+        if args.problems:
+            queries.append(('problem_iter', dict(acknowledged=False, chunk_size=chunk_size)))
+        if args.metrics:
+            queries.append(('metrics_stream', dict(host_id=args.hostid, chunk_size=chunk_size)))
+        if args.history:
+            queries.append(('history_export', dict(time_from=args.history[0], time_till=args.history[1],
+                                                   host_id=args.hostid, window=args.window or 3600,
+                                                   chunk_size=chunk_size,
+                                                   search_filter={'key_': args.key} if args.key else None)))
+        if args.rollup:
+            queries.append(('trend_rollup', dict(time_from=args.rollup[0], time_till=args.rollup[1],
+                                                 group_by=args.groupby, bucket=args.bucket, host_id=args.hostid,
+                                                 chunk_size=chunk_size, window=args.window or 86400,
+                                                 search_filter={'key_': args.key} if args.key else None)))
 
-    session = ZabbixAutomation(url=url, automation_prefix=prefix)
+        if fanout.login():
+            stream_lines(tagged_lines(itertools.chain.from_iterable(fanout.query(method, **kwargs)
+                                                                    for method, kwargs in queries)),
+                         args.output)
+            if token_cache is None:
+                fanout.logout()
+        fanout.close()
+        if stats is not None:
+            sys.stderr.write(stats.to_prometheus() if args.stats == 'prometheus'
+                             else json.dumps(stats.to_dict(), indent=2) + '\n')
+        sys.exit(1 if fanout.errors else 0)
+
+    session = ZabbixAutomation(url=url, automation_prefix=prefix, cache=cache, **api_settings)
     result = None
 
     if args.verbose:
@@ -70,13 +323,77 @@ if __name__ == "__main__":
 
     login_success = session.login(username=username, password=password)
 
+    if args.daemon:
+        action_specified = True
+        streamed = True
+        collect_metrics = args.metrics or not (args.problems or args.watch)
+        collect_problems = args.problems or not (args.metrics or args.watch)
+        cursor = MetricsCursor(args.cursor) if args.cursor else None
+        event_cursor = EventCursor(args.watch) if args.watch else None
+        out = open(args.output, 'a') if args.output else sys.stdout
+        tasks = []
+
+        def metrics_task():
+            for metric in session.metrics_stream(host_id=args.hostid, chunk_size=chunk_size, cursor=cursor,
+                                                 store=store):
+                out.write(metric + '\n')
+            out.flush()
+            if store is not None:
+                store.flush()
+            if cursor is not None:
+                cursor.save()
+
+        def problems_task():
+            if args.format == 'ndjson':
+                for problem in session.problem_iter(acknowledged=False, chunk_size=chunk_size):
+                    out.write(json.dumps(problem.to_dict(), sort_keys=True) + '\n')
+            else:
+                out.write(json.dumps(session.problem_get(acknowledged=False, chunk_size=chunk_size),
+                                     sort_keys=True) + '\n')
+            out.flush()
+
+        def events_task():
+            for event in session.event_watch(event_cursor, page_size=page_size):
+                out.write(json.dumps(event.to_dict(), sort_keys=True) + '\n')
+            out.flush()
+            event_cursor.save()
+
+        def settings_task():
+            # the configuration is reloaded only when the file changed
+            daemon_settings = conf.get('zabbix_api_settings')
+            poller.interval = daemon_settings['system_probe_wait']
+            poller.jitter = daemon_settings.get('system_probe_jitter', 0)
+
+        tasks.append(('settings', settings_task))
+        if collect_metrics:
+            tasks.append(('metrics', metrics_task))
+        if collect_problems:
+            tasks.append(('problems', problems_task))
+        if event_cursor is not None:
+            tasks.append(('events', events_task))
+
+        poller = ZabbixPoller(tasks, interval=probe_wait, jitter=probe_jitter, verbose=args.verbose)
+        signal.signal(signal.SIGTERM, poller.stop)
+        try:
+            poller.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
     if args.listhosts:
         action_specified = True
         if args.extend:
             output = 'extend'
         else:
             output = ['name', 'available']
-        result = session.host_get(host_output=output, host_available=None, host_id=args.hostid)
+        if args.stream:
+            streamed = True
+            stream_records(session.host_iter(host_output=output, host_available=None, host_id=args.hostid,
+                                              page_size=page_size), args.output)
+        else:
+            result = session.host_get(host_output=output, host_available=None, host_id=args.hostid)
 
     if args.listitems:
         action_specified=True
@@ -85,25 +402,75 @@ if __name__ == "__main__":
         else:
             output = ['description', 'lastvalue']
 
-        result = session.item_get(host_id=args.hostid, output=output)
+        if args.stream:
+            streamed = True
+            stream_records(session.item_iter(host_id=args.hostid, output=output, page_size=page_size),
+                           args.output)
+        else:
+            result = session.item_get(host_id=args.hostid, output=output)
 
     if args.listint:
         action_specified=True
-        result = session.interface_get(host_id=args.hostid)
+        if args.stream:
+            streamed = True
+            stream_records(session.interface_iter(host_id=args.hostid), args.output)
+        else:
+            result = session.interface_get(host_id=args.hostid)
+
+    if args.problems and not args.daemon:
+        action_specified=True
+        if args.stream:
+            streamed = True
+            stream_records(session.problem_iter(acknowledged=False, chunk_size=chunk_size), args.output)
+        else:
+            result = session.problem_get(acknowledged=False, chunk_size=chunk_size)
+
+    if args.watch and not args.daemon:
+        action_specified=True
+        streamed = True
+        event_cursor = EventCursor(args.watch)
+        if stream_records(session.event_watch(event_cursor, page_size=page_size), args.output):
+            event_cursor.save()
+
+    if args.metrics and not args.daemon:
+        action_specified=True
+        cursor = MetricsCursor(args.cursor) if args.cursor else None
+        if args.stream:
+            streamed = True
+            if not stream_lines(session.metrics_stream(host_id=args.hostid, chunk_size=chunk_size, cursor=cursor,
+                                                       store=store),
+                                args.output):
+                result = False
+        else:
+            result = session.metrics_get(host_id=args.hostid, chunk_size=chunk_size, cursor=cursor, store=store)
+        if cursor is not None and result is not False:
+            cursor.save()
 
-    if args.problems:
+    if args.history:
         action_specified=True
-        result = session.problem_get(acknowledged=False)
+        streamed = True
+        search_filter = {'key_': args.key} if args.key else None
+        stream_lines(session.history_export(args.history[0], args.history[1], host_id=args.hostid,
+                                            search_filter=search_filter, window=args.window or 3600,
+                                            chunk_size=chunk_size, store=store),
+                     args.output)
 
-    if args.metrics:
+    if args.rollup:
         action_specified=True
-        result = session.metrics_get(host_id=args.hostid)
+        streamed = True
+        search_filter = {'key_': args.key} if args.key else None
+        stream_lines(tsdb_lines(session.trend_rollup(args.rollup[0], args.rollup[1], group_by=args.groupby,
+                                                     bucket=args.bucket, host_id=args.hostid,
+                                                     search_filter=search_filter, chunk_size=chunk_size,
+                                                     window=args.window or 86400)),
+                     args.output)
 
     if args.addalert:
         action_specified=True
         result = session.create_action(notification_endpoint,
                                         notification_script,
-                                        notification_template)
+                                        notification_template,
+                                        max_sessions=notification_max_sessions)
 
     if args.delalert:
         action_specified=True
@@ -111,25 +478,30 @@ if __name__ == "__main__":
 
     if args.additem:
         action_specified=True
-        result = {}
-        counter = 0
-        hosts = session.host_get(host_output=['name', 'available'], host_available=None, host_id=args.hostid)
-        for host in hosts.itervalues():
-            for key, value in items.items():
-                items=session.item_create(host_id=host['hostid'],
-                                          item_key=value['key'],
-                                          item_delay=value['delay'],
-                                          item_description=value['description'],
-                                          item_type=value['type'],
-                                          item_value_type=value['value_type']
-                                          )
-                result.update({counter: items})
-                counter += 1
+        if args.trapper:
+            result = session.trapper_item_create(items.values(), host_id=args.hostid, chunk_size=chunk_size)
+        else:
+            result = session.item_bulk_create(items.values(), host_id=args.hostid, chunk_size=chunk_size)
+
+    if args.send:
+        action_specified=True
+        sender = ZabbixSender(settings.get('trapper_server') or urlparse(url).hostname,
+                              port=settings.get('trapper_port', 10051), timeout=timeout,
+                              batch_size=settings.get('sender_batch_size', 1000))
+        try:
+            result = sender.send(sender_values(args.send))
+        except (ZabbixApiException, IOError) as ex:
+            ZabbixAutomation.automation_exception(str(ex))
+            result = False
+        finally:
+            sender.close()
 
     if args.delitem:
         action_specified=True
         result = session.item_delete(args.delitem)
 
+    envelope = result
+
     if result is True:
         result = "Success!"
     elif result is False:
@@ -137,12 +509,29 @@ if __name__ == "__main__":
     elif result == {}:
         result = "Empty response"
 
-    logout_success = session.logout()
+    if token_cache is not None:
+        # keep the session open, the next run reuses its token
+        logout_success = session.token is not None
+    else:
+        logout_success = session.logout()
+    session.close()
+    if store is not None:
+        store.close()
+
+    if stats is not None:
+        if args.stats == 'prometheus':
+            sys.stderr.write(stats.to_prometheus())
+        else:
+            sys.stderr.write(json.dumps(stats.to_dict(), indent=2) + '\n')
 
     if login_success and logout_success:
         if not action_specified:
             print 'No action specified use -h to show usage'
             print '\033[92mConnection success\033[0m'
+        elif streamed:
+            pass
+        elif args.format == 'mooncloud':
+            session.mooncloud_json(envelope)
         else:
             print '\033[94m'+json.dumps(result, indent=2, sort_keys=True) + '\033[0m'
     else:
@@ -1,8 +1,20 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import uuid
+import time
+import random
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from zabbixapi_exception import ZabbixApiException
 from zabbixapi_exception import ZabbixIncompatibleApi
+from zabbixapi_exception import ZabbixNotAuthenticated
 from zabbixapi_exception import ZabbixNotPermitted
+from zabbixapi_exception import ZabbixTransportError
+from zabbixapi_exception import ZabbixCircuitOpen
+from zabbixjson import json_backend
+from zabbixjson import ResultStreamDecoder
 
 
 class ZabbixApi(object):
@@ -12,25 +24,115 @@ class ZabbixApi(object):
     we don't have to define every api call but we can model them following the Zabbix doc
     https://www.zabbix.com/documentation/3.4/manual/api
     """
-    def __init__(self, url, json_rpc='2.0', content_type='application/json-rpc', invalid_cert=False, timeout=7, enable_debug=False):
+    def __init__(self, url, json_rpc='2.0', content_type='application/json-rpc', invalid_cert=False, timeout=7,
+                 enable_debug=False, pool_size=10, keep_alive=True, compression=True, max_workers=1, cache=None,
+                 token_cache=None, stats=None, json_decoder='json', stream_chunk_size=65536, retries=0,
+                 retry_backoff=0.5, retry_backoff_max=10, limiter=None, circuit_breaker=None):
         self.url = url.rstrip('/') + '/api_jsonrpc.php'
         self.content_type = content_type
         self.json_rpc = json_rpc
         self.token = None
+        self.username = None
+        self.password = None
+        self.login_lock = threading.Lock()
         self.version = None
         self.timeout = timeout
-        self.ssl_verify = invalid_cert
+        # accepting an invalid certificate means skipping the verification
+        self.ssl_verify = not invalid_cert
         self.debug_enabled = enable_debug
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.compression = compression
+        self.max_workers = max(1, max_workers)
+        self.cache = cache
+        self.token_cache = token_cache
+        self.stats = stats
+        self.json_loads = json_backend(json_decoder)
+        self.stream_chunk_size = stream_chunk_size
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.limiter = limiter
+        self.circuit_breaker = circuit_breaker
+        self.streaming = ZabbixApiStream(self)
+        self.worker_pool = None
+        self.worker_pool_lock = threading.Lock()
+        self.session = self.create_session()
         requests.packages.urllib3.disable_warnings()
 
-    def call_api(self, method, headers, body):
+    def create_session(self):
+
+        """
+        build the long-lived http session shared by every api call, the adapter keeps
+        up to pool_size connections open to the zabbix frontend so we pay the tcp/tls
+        handshake only once
+        """
+        session = requests.Session()
+        # every worker thread must be able to hold its own connection
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.pool_size, self.max_workers))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        if self.keep_alive:
+            session.headers.update({'Connection': 'keep-alive'})
+        else:
+            session.headers.update({'Connection': 'close'})
+
+        if self.compression:
+            session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+        else:
+            session.headers.update({'Accept-Encoding': 'identity'})
+        return session
+
+    def close(self):
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+            self.worker_pool.join()
+            self.worker_pool = None
+        self.session.close()
+
+    def concurrent_imap(self, function, iterable):
+
+        """
+        apply function to every element of iterable using up to max_workers threads
+        and yield the results in input order. At most twice max_workers calls are in
+        flight so arbitrarily long iterables are consumed lazily. With max_workers set
+        to 1 everything runs sequentially in the calling thread
+        """
+        if self.max_workers <= 1:
+            for element in iterable:
+                yield function(element)
+            return
+
+        with self.worker_pool_lock:
+            if self.worker_pool is None:
+                self.worker_pool = ThreadPool(self.max_workers)
+        pending = deque()
+        for element in iterable:
+            pending.append(self.worker_pool.apply_async(function, (element,)))
+            if len(pending) >= self.max_workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def call_api(self, method, headers, body, relogin=True):
 
         """
         this function handle all api call to zabbix server and automatically insert
-        id and auth token if it exists
+        id and auth token if it exists. When the session expired the call is retried
+        once after a new login with the stored credentials
         """
 
         call_id = str(uuid.uuid4())
+        cacheable = False
+
+        if body is not None and self.cache is not None:
+            cacheable = self.cache.cacheable(body['method'], body['params'])
+            if cacheable:
+                hit, value = self.cache.get(body['method'], body['params'])
+                if hit:
+                    return value
+                generation = self.cache.generation
 
         if body is not None:
             body.update({'id': call_id})
@@ -38,23 +140,27 @@ class ZabbixApi(object):
             if self.token is not None:
                 body.update({'auth': self.token})
 
+        api_method = body['method'] if body is not None else method
+        started = time.time()
+        data = json.dumps(body)
+        serialized = time.time()
+
         if self.debug_enabled:
-            print('\033[92m[DEBUG request]: {}\033[0m'.format(json.dumps(body)))
+            print('\033[92m[DEBUG request]: {}\033[0m'.format(data))
         try:
-            if method == 'post':
-                response = requests.post(self.url, headers=headers, data=json.dumps(body), verify=self.ssl_verify,
-                                         timeout=self.timeout)
-            elif method == 'get':
-                response = requests.get(self.url, headers=headers, verify=self.ssl_verify, timeout=self.timeout)
-            else:
-                raise NotImplemented('Invalid method'.format(method))
-            if self.debug_enabled:
-                print('\033[92m[DEBUG response]: {}\033[0m'.format(response.text))
-
-        except Exception as ex:
-            print("\033[91m[ERROR]: {}\033[0m".format(ex.message))
-            response = {'result': ex.message}
-            return response
+            response = self.send(method, api_method, headers, data,
+                                 idempotent=body is not None and body['method'].endswith('.get'))
+        except ZabbixTransportError:
+            self.record_stats(api_method, started, serialized, time.time(), time.time(), len(data), 0, True)
+            raise
+        finally:
+            # after the answer: a read cached while the write was in flight may hold the old data
+            if body is not None and self.cache is not None:
+                self.cache.invalidate(body['method'])
+        content = response.content
+        if self.debug_enabled:
+            print('\033[92m[DEBUG response]: {}\033[0m'.format(response.text))
+        received = time.time()
 
         try:
             response.raise_for_status()
@@ -62,20 +168,207 @@ class ZabbixApi(object):
         except Exception:
             print("Bad return code {}".format(response.status_code))
 
-        json_response = json.loads(response.text)
+        try:
+            json_response = self.json_loads(content)
+            self.check_error(json_response)
+        except ZabbixNotAuthenticated:
+            self.record_stats(api_method, started, serialized, received, time.time(), len(data), len(content), True)
+            if not relogin or self.username is None or body['method'].startswith('user.log'):
+                raise
+            self.relogin(body.get('auth'))
+            return self.call_api(method, headers, body, relogin=False)
+        except Exception:
+            self.record_stats(api_method, started, serialized, received, time.time(), len(data), len(content), True)
+            raise
+        if 'error' in json_response:
+            self.record_stats(api_method, started, serialized, received, time.time(), len(data), len(content), True)
+            raise ZabbixApiException(self.error_message(json_response))
+        self.record_stats(api_method, started, serialized, received, time.time(), len(data), len(content), False)
+
+        if cacheable and 'result' in json_response:
+            self.cache.put(body['method'], body['params'], json_response['result'], generation=generation)
+
+        return json_response['result']
+
+    def iter_api(self, headers, body, relogin=True):
+
+        """
+        like call_api but the response is decoded while it is downloaded and the
+        elements of the result array are yielded one by one, so neither the raw body
+        nor the whole decoded list is ever held in memory. A scalar or object result
+        is yielded as a single element. Responses are not cached
+        """
+        body.update({'id': str(uuid.uuid4())})
+        if self.token is not None:
+            body.update({'auth': self.token})
 
+        started = time.time()
+        data = json.dumps(body)
+        serialized = time.time()
+        if self.debug_enabled:
+            print('\033[92m[DEBUG stream request]: {}\033[0m'.format(data))
+
+        received_bytes = 0
+        yielded = False
+        error = True
+        decoder = ResultStreamDecoder(self.json_loads)
         try:
+            # only the request is retried, an answer cut while streaming is not
+            response = self.send('post', body['method'], headers, data, idempotent=body['method'].endswith('.get'),
+                                 stream=True)
+            try:
+                response.raise_for_status()
+            except Exception:
+                print("Bad return code {}".format(response.status_code))
+            try:
+                for chunk in response.iter_content(self.stream_chunk_size):
+                    received_bytes += len(chunk)
+                    for element in decoder.feed(chunk):
+                        yielded = True
+                        yield element
+                json_response = decoder.finish()
+            except requests.exceptions.RequestException as ex:
+                raise ZabbixTransportError('{} interrupted: {}'.format(body['method'], ex))
+            finally:
+                response.close()
+
+            if json_response is not None:
+                try:
+                    self.check_error(json_response)
+                except ZabbixNotAuthenticated:
+                    if not relogin or self.username is None or yielded:
+                        raise
+                    self.relogin(body.get('auth'))
+                    for element in self.iter_api(headers, body, relogin=False):
+                        yield element
+                    error = False
+                    return
+                if 'error' in json_response:
+                    raise ZabbixApiException(self.error_message(json_response))
+                result = json_response['result']
+                for element in result if isinstance(result, list) else [result]:
+                    yield element
+            error = False
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(body['method'])
+            finished = time.time()
+            self.record_stats(body['method'], started, serialized, finished, finished, len(data), received_bytes,
+                              error)
+
+    def send(self, method, api_method, headers, data, idempotent=False, stream=False):
+
+        """
+        send one http request through the circuit breaker and the concurrency limiter.
+        Timeouts, connection errors and 5xx answers raise ZabbixTransportError, for
+        idempotent calls (*.get) they are first retried up to retries times after a
+        random delay between 0 and retry_backoff * 2^attempt seconds (full jitter, so
+        clients failing together don't come back together)
+        """
+        attempt = 0
+        last_error = None
+        while True:
+            try:
+                return self.send_once(method, api_method, headers, data, stream)
+            except ZabbixCircuitOpen:
+                # the failure that opened the circuit tells more than the circuit itself
+                if last_error is not None:
+                    raise last_error
+                raise
+            except ZabbixTransportError as ex:
+                last_error = ex
+                if not idempotent or attempt >= self.retries:
+                    raise
+                delay = random.uniform(0, min(self.retry_backoff_max, self.retry_backoff * 2 ** attempt))
+                attempt += 1
+                if self.debug_enabled:
+                    print('\033[93m[RETRY {}/{}]: {} in {:.2f}s\033[0m'.format(attempt, self.retries, ex, delay))
+                time.sleep(delay)
+
+    def send_once(self, method, api_method, headers, data, stream):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_call()
+        if self.limiter is not None:
+            self.limiter.acquire()
+        started = time.time()
+        failed = True
+        try:
+            try:
+                if method == 'post':
+                    response = self.session.post(self.url, headers=headers, data=data,
+                                                 verify=self.ssl_verify, timeout=self.timeout, stream=stream)
+                elif method == 'get':
+                    response = self.session.get(self.url, headers=headers, verify=self.ssl_verify,
+                                                timeout=self.timeout, stream=stream)
+                else:
+                    raise ValueError('Invalid method {}'.format(method))
+            except requests.exceptions.RequestException as ex:
+                raise ZabbixTransportError('{} failed: {}'.format(api_method, ex))
+            if response.status_code >= 500:
+                response.close()
+                raise ZabbixTransportError('{} failed: {} {}'.format(api_method, response.status_code,
+                                                                     response.reason))
+            failed = False
+            return response
+        finally:
+            if self.limiter is not None:
+                self.limiter.release(api_method, time.time() - started, failed)
+            if self.circuit_breaker is not None:
+                if failed:
+                    self.circuit_breaker.failure()
+                else:
+                    self.circuit_breaker.success()
+
+    def record_stats(self, api_method, started, serialized, received, parsed, request_bytes, response_bytes, error):
+        if self.stats is None:
+            return
+        self.stats.record(api_method, parsed - started,
+                          request_bytes=request_bytes,
+                          response_bytes=response_bytes,
+                          serialize=serialized - started,
+                          network=received - serialized,
+                          parse=parsed - received,
+                          error=error)
+
+    @staticmethod
+    def check_error(json_response):
+
+        """
+        map a json-rpc error object to the matching exception, responses
+        without an error member are left untouched
+        """
+        try:
+            data = json_response['error'].get('data')
+            if not isinstance(data, basestring):
+                data = repr(data)
+            if any(message in data for message in ('Session terminated', 'Not authorised', 'Not authorized')):
+                raise ZabbixNotAuthenticated(ZabbixApi.error_message(json_response))
             if json_response['error']['code'] == -32602:
-                raise ZabbixIncompatibleApi("\033[91m[ERROR]:{} code {}\033[0m".format(json_response['error']['data'],
-                                                                                 json_response['error']['code']))
+                raise ZabbixIncompatibleApi(ZabbixApi.error_message(json_response))
             if json_response['error']['code'] == -32500:
-                raise ZabbixNotPermitted("\033[91m[ERROR]:{} code {}\033[0m".format(json_response['error']['data'],
-                                                                              json_response['error']['code']))
+                raise ZabbixNotPermitted(ZabbixApi.error_message(json_response))
 
-        except KeyError:
+        except (KeyError, AttributeError, TypeError):
             pass
 
-        return json_response['result']
+    @staticmethod
+    def error_message(json_response):
+        error = json_response['error']
+        if not isinstance(error, dict):
+            error = {'data': error}
+        data = error.get('data', error.get('message'))
+        # the frontend may answer in any language, keep the message a byte string
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        return "\033[91m[ERROR]:{} code {}\033[0m".format(data, error.get('code'))
+
+    def batch(self):
+
+        """
+        return a batch collector, every call made through it is queued and sent
+        together with the others in a single json-rpc batch request
+        """
+        return ZabbixApiBatch(self)
 
     # todo create api version control
 
@@ -91,7 +384,32 @@ class ZabbixApi(object):
         r = self.call_api('post', headers, params)
         self.version = r
 
-    def login(self, username, password):
+    def login(self, username, password, use_token_cache=True):
+
+        """
+        with a token cache configured a token saved by a previous run is checked with
+        one cheap authenticated call and reused when the server still accepts it, a
+        rejected token is dropped from the cache and replaced by a user.login
+        """
+        if use_token_cache and self.token_cache is not None:
+            token = self.token_cache.get(self.url, username)
+            if token is not None:
+                self.token = token
+                try:
+                    self.call_api('post', {'Content-Type': self.content_type},
+                                  {'jsonrpc': self.json_rpc, 'method': 'user.get',
+                                   'params': {'output': ['userid'], 'limit': 1}}, relogin=False)
+                except ZabbixNotAuthenticated:
+                    self.token = None
+                    self.token_cache.delete(self.url, username)
+                except ZabbixApiException as ex:
+                    print("\033[91m[ERROR]: login failed, {}\033[0m".format(ex))
+                    self.token = None
+                    return False
+                else:
+                    self.username = username
+                    self.password = password
+                    return True
 
         headers = {'Content-Type': self.content_type}
         params = {
@@ -100,14 +418,34 @@ class ZabbixApi(object):
             'params': {'user': username, 'password': password},
         }
 
-        r = self.call_api('post', headers, params)
+        try:
+            r = self.call_api('post', headers, params)
+        except ZabbixApiException as ex:
+            print("\033[91m[ERROR]: login failed, {}\033[0m".format(ex))
+            self.token = None
+            return False
 
         if type(r) is str or type(r) is unicode:
             self.token = r
+            self.username = username
+            self.password = password
+            if self.token_cache is not None:
+                self.token_cache.put(self.url, username, r)
         else:
             self.token = None
         return True
 
+    def relogin(self, expired_token):
+
+        """
+        log in again after the session expired, if another thread already
+        replaced the expired token there is nothing to do
+        """
+        with self.login_lock:
+            if self.token == expired_token:
+                self.token = None
+                self.login(self.username, self.password, use_token_cache=False)
+
     def logout(self):
         if self.token is not None:
             headers = {'Content-Type': self.content_type}
@@ -117,9 +455,17 @@ class ZabbixApi(object):
                 'params': {},
             }
 
-            r = self.call_api('post', headers, params)
+            try:
+                r = self.call_api('post', headers, params)
+            except ZabbixApiException as ex:
+                print("\033[91m[ERROR]: logout failed, {}\033[0m".format(ex))
+                return False
             if str(r).lower() == 'true':
+                if self.token_cache is not None:
+                    self.token_cache.delete(self.url, self.username)
                 self.token = None
+                self.username = None
+                self.password = None
         else:
             return False
         return True
@@ -141,7 +487,9 @@ class ZabbixAPICommonObj(object):
 
     def __getattr__(self, zbmethod):
         # print('Calling __getattr__: {}'.format(zbmethod))
-        self.zbmethod = zbmethod
+        # the method name is bound to the closure and never stored on the shared
+        # instance, so concurrent threads calling different methods don't clash
+        method = self.zbobj + '.' + zbmethod
 
         def get_arguments(*arg, **kw):
 
@@ -154,7 +502,7 @@ class ZabbixAPICommonObj(object):
             headers = {'Content-Type': self.parent.content_type}
             params = {
                 'jsonrpc': self.parent.json_rpc,
-                'method': self.zbobj + '.' + self.zbmethod,
+                'method': method,
                 'params': kw or arg
             }
             r = self.parent.call_api('post', headers, params)
@@ -162,3 +510,210 @@ class ZabbixAPICommonObj(object):
             #print('{}'.format(r))
             return r
         return get_arguments
+
+
+class ZabbixApiBatch(object):
+    """
+    collects calls made with the usual dynamic binding (batch.host.get(...)) and
+    sends them as one json-rpc 2.0 batch array. Every call returns a ZabbixBatchResult
+    which is resolved, by id, once the batch is sent. It can be used as a context
+    manager, the batch is sent on exit
+
+        with api.batch() as batch:
+            hosts = batch.host.get(output=['host'])
+            items = batch.item.get(output=['key_'])
+        print hosts.result, items.result
+    """
+    def __init__(self, parent):
+        self.parent = parent
+        self.content_type = parent.content_type
+        self.json_rpc = parent.json_rpc
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+        return False
+
+    def __len__(self):
+        return len(self.calls)
+
+    def call_api(self, method, headers, body):
+
+        """
+        same signature of ZabbixApi.call_api so ZabbixAPICommonObj can be
+        reused as is, the body is only queued here
+        """
+        call_id = str(uuid.uuid4())
+        body.update({'id': call_id})
+        pending = ZabbixBatchResult(call_id, body['method'])
+        self.calls.append((body, pending))
+        return pending
+
+    def send(self, relogin=True):
+
+        """
+        post all queued calls in a single request and resolve every pending result,
+        a transport failure is propagated to each call of the batch. When the session
+        expired the whole batch is sent once more after a new login, like call_api
+        """
+        if not self.calls:
+            return []
+
+        parent = self.parent
+        headers = {'Content-Type': self.content_type}
+        token = parent.token
+        calls = self.calls
+        bodies = []
+        pending = {}
+        for body, result in calls:
+            if token is not None:
+                body.update({'auth': token})
+            bodies.append(body)
+            pending[body['id']] = result
+        results = [result for body, result in calls]
+        self.calls = []
+
+        started = time.time()
+        data = json.dumps(bodies)
+        serialized = received = time.time()
+        content = ''
+        if parent.debug_enabled:
+            print('\033[92m[DEBUG batch request]: {}\033[0m'.format(data))
+        try:
+            response = parent.send('post', 'batch', headers, data,
+                                   idempotent=all(body['method'].endswith('.get') for body in bodies))
+            content = response.content
+            received = time.time()
+            if parent.debug_enabled:
+                print('\033[92m[DEBUG batch response]: {}\033[0m'.format(response.text))
+            response.raise_for_status()
+            json_response = parent.json_loads(content)
+        except Exception as ex:
+            self.record_stats(bodies, None, started, serialized, received, time.time(), len(data), len(content))
+            self.invalidate(bodies)
+            print("\033[91m[ERROR]: {}\033[0m".format(ex))
+            if not isinstance(ex, ZabbixApiException):
+                ex = ZabbixApiException(str(ex))
+            for result in results:
+                result.set_exception(ex)
+            return results
+        # only now the writes are applied, a read cached earlier could hold the old data
+        self.invalidate(bodies)
+
+        # a malformed batch is answered with a single error object
+        if type(json_response) is not list:
+            json_response = [json_response]
+        answered = set(entry.get('id') for entry in json_response if isinstance(entry, dict) and 'error' not in entry)
+        self.record_stats(bodies, answered, started, serialized, received, time.time(), len(data), len(content))
+
+        if relogin and parent.username is not None and self.expired(json_response) and \
+                not any(body['method'].startswith('user.log') for body in bodies):
+            parent.relogin(token)
+            self.calls = calls
+            return self.send(relogin=False)
+
+        for entry in json_response:
+            result = pending.pop(entry.get('id'), None)
+            if result is None:
+                continue
+            try:
+                ZabbixApi.check_error(entry)
+                if 'error' in entry:
+                    raise ZabbixApiException(ZabbixApi.error_message(entry))
+                result.set_result(entry['result'])
+            except ZabbixApiException as ex:
+                result.set_exception(ex)
+
+        for result in pending.values():
+            result.set_exception(ZabbixApiException('no response for {} id {}'.format(result.method,
+                                                                                     result.call_id)))
+        return results
+
+    def record_stats(self, bodies, answered, started, serialized, received, parsed, request_bytes, response_bytes):
+
+        """
+        record every call of the batch under its own method, as an error unless its id
+        is in answered. Each call waited for the whole batch, the bytes and the encode,
+        network and decode times are shared out so their totals are the request's
+        """
+        stats = self.parent.stats
+        if stats is None:
+            return
+        count = len(bodies)
+        for index, body in enumerate(bodies):
+            stats.record(body['method'], parsed - started,
+                         request_bytes=request_bytes // count + (1 if index < request_bytes % count else 0),
+                         response_bytes=response_bytes // count + (1 if index < response_bytes % count else 0),
+                         serialize=(serialized - started) / count,
+                         network=(received - serialized) / count,
+                         parse=(parsed - received) / count,
+                         error=answered is None or body['id'] not in answered)
+
+    def invalidate(self, bodies):
+        if self.parent.cache is not None:
+            for body in bodies:
+                self.parent.cache.invalidate(body['method'])
+
+    @staticmethod
+    def expired(json_response):
+        for entry in json_response:
+            try:
+                ZabbixApi.check_error(entry)
+            except ZabbixNotAuthenticated:
+                return True
+            except ZabbixApiException:
+                pass
+        return False
+
+    def __getattr__(self, zbobj):
+        return ZabbixAPICommonObj(zbobj, self)
+
+
+class ZabbixBatchResult(object):
+    """
+    placeholder returned by batched calls, reading result before the batch
+    is sent or when the call failed raises an exception
+    """
+    def __init__(self, call_id, method):
+        self.call_id = call_id
+        self.method = method
+        self.done = False
+        self.value = None
+        self.exception = None
+
+    def set_result(self, value):
+        self.value = value
+        self.done = True
+
+    def set_exception(self, exception):
+        self.exception = exception
+        self.done = True
+
+    @property
+    def result(self):
+        if not self.done:
+            raise ZabbixApiException('batch not sent yet for {}'.format(self.method))
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+class ZabbixApiStream(object):
+    """
+    dynamic binding (api.streaming.item.get(...)) returning a generator over the
+    result elements decoded incrementally by ZabbixApi.iter_api
+    """
+    def __init__(self, parent):
+        self.parent = parent
+        self.content_type = parent.content_type
+        self.json_rpc = parent.json_rpc
+
+    def call_api(self, method, headers, body):
+        return self.parent.iter_api(headers, body)
+
+    def __getattr__(self, zbobj):
+        return ZabbixAPICommonObj(zbobj, self)
@@ -20,4 +20,22 @@ class ZabbixIncompatibleApi(ZabbixApiException):
 class ZabbixNotPermitted(ZabbixApiException):
     def __init__(self, message):
 
-        super(ZabbixNotPermitted, self).__init__(message)
\ No newline at end of file
+        super(ZabbixNotPermitted, self).__init__(message)
+
+
+class ZabbixTransportError(ZabbixApiException):
+    def __init__(self, message):
+
+        super(ZabbixTransportError, self).__init__(message)
+
+
+class ZabbixCircuitOpen(ZabbixTransportError):
+    def __init__(self, message):
+
+        super(ZabbixCircuitOpen, self).__init__(message)
+
+
+class ZabbixSenderError(ZabbixApiException):
+    def __init__(self, message):
+
+        super(ZabbixSenderError, self).__init__(message)
@@ -2,13 +2,15 @@ import uuid
 import json
 from zabbixapi import ZabbixApi
 import zabbixapi_exception
+from zabbixrecords import HostRecord, ItemRecord, InterfaceRecord, ProblemRecord, EventRecord
+from zabbixrollup import GROUP_BY, TrendColumns, TrendRollup
+from zabbixsender import TRAPPER
 
 
 class ZabbixAutomation(ZabbixApi):
-    def __init__(self, url, automation_prefix):
-        super(ZabbixAutomation, self).__init__(url)
+    def __init__(self, url, automation_prefix, **api_settings):
+        super(ZabbixAutomation, self).__init__(url, **api_settings)
         self.automation_prefix = automation_prefix
-        self.debug_enabled = False
 
     def enable_debug(self, enabled):
         if enabled:
@@ -27,6 +29,32 @@ class ZabbixAutomation(ZabbixApi):
             return False
         return items_list
 
+    def item_iter(self, item_id=None, host_id=None, search_filter=None, output=None, page_size=1000):
+
+        """
+        page through item.get results. The matching itemids are listed first (id only,
+        sorted ascending) and used as cursor, then every page of page_size ids is fetched
+        with the requested output so no single response holds the whole inventory.
+        With page_size set to 0 a single item.get is sent and decoded while it streams in.
+        Items are yielded as ItemRecord
+        """
+        if not page_size:
+            for item in self.streaming.item.get(output=output, hostids=host_id, itemids=item_id,
+                                                search=search_filter, sortfield='itemid', sortorder='ASC'):
+                yield ItemRecord(item)
+            return
+
+        ids = self.item.get(output=['itemid'], hostids=host_id, itemids=item_id, search=search_filter,
+                            sortfield='itemid', sortorder='ASC')
+        ids = sorted((item['itemid'] for item in ids), key=int)
+
+        def fetch_page(page):
+            return self.item.get(output=output, itemids=page, sortfield='itemid', sortorder='ASC')
+
+        for items in self.concurrent_imap(fetch_page, self.chunks(ids, page_size)):
+            for item in items:
+                yield ItemRecord(item)
+
     def item_create(self,
                     item_key,
                     item_delay,
@@ -42,8 +70,11 @@ class ZabbixAutomation(ZabbixApi):
         if type(host_id) is list:
             raise TypeError('only one host supported')
 
-        host = self.host.get(output=['host', 'hostid'], hostids=host_id)[0]
-        host.update(self.hostinterface.get(output='extend', filter={'main': 1, 'hostid': host_id})[0])
+        with self.batch() as batch:
+            hosts = batch.host.get(output=['host', 'hostid'], hostids=host_id)
+            interfaces = batch.hostinterface.get(output='extend', filter={'main': 1, 'hostid': host_id})
+        host = hosts.result[0]
+        host.update(interfaces.result[0])
         try:
             added_item = self.item.create(name=id_prefix + str(uuid.uuid4()),
                                           key_=item_key,
@@ -65,6 +96,93 @@ class ZabbixAutomation(ZabbixApi):
 
         return added_list
 
+    def item_bulk_create(self, items, host_id=None, chunk_size=500):
+
+        """
+        create every item definition of items (zabbix_items values) on every host.
+        Main interfaces are resolved with a single hostinterface.get and items are sent
+        as array item.create calls of chunk_size items, the result maps each hostid to
+        its created itemids or to its errors. item.create is all or nothing, a chunk that
+        fails is sent again host by host so one host (e.g. whose keys already exist) does
+        not fail the others. Trapper items have no interface, a list made of trapper
+        items only is created on every host
+        """
+        id_prefix = self.automation_prefix + '_'
+        results = {}
+        trappers_only = all(int(item['type']) == TRAPPER for item in items)
+
+        try:
+            if trappers_only:
+                interfaces = [{'hostid': host['hostid'], 'interfaceid': None}
+                              for host in self.host.get(output=['hostid'], hostids=host_id)]
+            else:
+                interfaces = self.hostinterface.get(output=['interfaceid', 'hostid'], hostids=host_id,
+                                                    filter={'main': 1})
+        except Exception as ex:
+            self.automation_exception(ex.message)
+            return False
+
+        main_interfaces = {}
+        for interface in interfaces:
+            main_interfaces.setdefault(interface['hostid'], interface['interfaceid'])
+
+        if host_id is not None:
+            host_ids = host_id if type(host_id) in (list, tuple) else [host_id]
+            for missing in set(str(host) for host in host_ids) - set(main_interfaces):
+                results[missing] = {'success': False, 'itemids': [],
+                                    'errors': ['host not found' if trappers_only else 'no main interface found']}
+
+        payload = []
+        for hostid, interfaceid in sorted(main_interfaces.items()):
+            results[hostid] = {'success': True, 'itemids': [], 'errors': []}
+            for item in items:
+                definition = {'name': id_prefix + str(uuid.uuid4()),
+                              'key_': item['key'],
+                              'hostid': hostid,
+                              'delay': item['delay'],
+                              'type': item['type'],
+                              'value_type': item['value_type'],
+                              'description': item['description']}
+                if int(item['type']) != TRAPPER:
+                    definition['interfaceid'] = interfaceid
+                payload.append(definition)
+
+        def create(definitions):
+            try:
+                return definitions, self.item.create(*definitions)['itemids'], None
+            except Exception as ex:
+                return definitions, None, ex
+
+        def create_chunk(chunk):
+            outcome = create(chunk)
+            hosts = {}
+            for item in chunk:
+                hosts.setdefault(item['hostid'], []).append(item)
+            if outcome[2] is None or len(hosts) == 1:
+                return [outcome]
+            # item.create is transactional, find out which hosts made the whole chunk fail
+            return [create(hosts[hostid]) for hostid in sorted(hosts)]
+
+        for outcomes in self.concurrent_imap(create_chunk, self.chunks(payload, chunk_size)):
+            for definitions, itemids, error in outcomes:
+                if error is not None:
+                    results[definitions[0]['hostid']]['success'] = False
+                    results[definitions[0]['hostid']]['errors'].append(str(error))
+                    continue
+                for item, itemid in zip(definitions, itemids):
+                    results[item['hostid']]['itemids'].append(itemid)
+
+        return results
+
+    def trapper_item_create(self, items, host_id=None, chunk_size=500):
+
+        """
+        item_bulk_create of the definitions of items turned into trapper items,
+        whose values are pushed with ZabbixSender instead of polled
+        """
+        return self.item_bulk_create([dict(item, type=TRAPPER, delay='0') for item in items], host_id=host_id,
+                                     chunk_size=chunk_size)
+
     def item_delete(self, item_id):
         try:
             if type(item_id) is list or type(item_id) is tuple:
@@ -109,6 +227,35 @@ class ZabbixAutomation(ZabbixApi):
 
         return hosts_list
 
+    def host_iter(self, host_id=None, host_available=None, host_output=None, host_filter=None, page_size=1000):
+
+        """
+        page through host.get results using the sorted hostids as cursor and
+        yield HostRecord, see item_iter
+        """
+        host_filter = dict(host_filter or {})
+        if host_available is True:
+            host_filter.update({'available': 1})
+        elif host_available is False:
+            host_filter.update({'available': 2})
+
+        if not page_size:
+            for host in self.streaming.host.get(output=host_output, hostids=host_id, filter=host_filter or None,
+                                                sortfield='hostid', sortorder='ASC'):
+                yield HostRecord(host)
+            return
+
+        ids = self.host.get(output=['hostid'], hostids=host_id, filter=host_filter or None,
+                            sortfield='hostid', sortorder='ASC')
+        ids = sorted((host['hostid'] for host in ids), key=int)
+
+        def fetch_page(page):
+            return self.host.get(output=host_output, hostids=page, sortfield='hostid', sortorder='ASC')
+
+        for hosts in self.concurrent_imap(fetch_page, self.chunks(ids, page_size)):
+            for host in hosts:
+                yield HostRecord(host)
+
     def host_delete(self, host_id):
         try:
             deleted_list = {"deleted": {}}
@@ -128,22 +275,10 @@ class ZabbixAutomation(ZabbixApi):
         return deleted_list
 
     def interface_get(self, host_id=None, only_main=False):
-        interfaces_filter = {}
         interfaces_list = {}
-        if host_id is not None:
-            interfaces_filter = {'hostid': host_id}
-
-        if only_main is True:
-            interfaces_filter.update({'main': 1})
-
         try:
-            interfaces = self.hostinterface.get(output='extend',
-                                                filter=interfaces_filter)
-            for interface in interfaces:
-                interfaces_list.update({interface['hostid']: {}})
-
-            for interface in interfaces:
-                interfaces_list[interface['hostid']].update({interface['interfaceid']: interface})
+            for interface in self.interface_iter(host_id=host_id, only_main=only_main):
+                interfaces_list.setdefault(interface.hostid, {})[interface.interfaceid] = interface.to_dict()
 
         except Exception as ex:
             self.automation_exception(ex.message)
@@ -151,28 +286,28 @@ class ZabbixAutomation(ZabbixApi):
 
         return interfaces_list
 
-    def metrics_get(self, host_id=None):
+    def interface_iter(self, host_id=None, only_main=False):
+
+        """
+        yield the host interfaces as InterfaceRecord
+        """
+        interfaces_filter = {}
+        if host_id is not None:
+            interfaces_filter = {'hostid': host_id}
+
+        if only_main is True:
+            interfaces_filter.update({'main': 1})
+
+        for interface in self.hostinterface.get(output='extend', filter=interfaces_filter):
+            yield InterfaceRecord(interface)
+
+    def metrics_get(self, host_id=None, chunk_size=500, cursor=None, store=None):
         metrics = {}
-        items = None
         metrics_counter = 0
         try:
-            hosts = self.host.get(output=['host', 'hostid'], hostids=host_id, filter={'available': 1})
-            if hosts is []:
-                raise Exception("no host found or unavailable")
-            for host in hosts:
-                items = self.item.get(output=['hostid', 'key_', 'lastvalue',
-                                              'description', 'state', 'lastclock'],
-                                      hostids=host['hostid'],
-                                      selectHosts={"output": "name"})
-
-                if items is None:
-                    raise ValueError('No item found for host ' + str(host_id))
-                else:
-                    for item in items:
-                        metric_string = '{}.{}'.format(item['hosts'][0]['name'], item['key_'])
-                        metrics.update({metrics_counter: '{} {} {}'.format(metric_string,
-                                                                           item['lastvalue'], item['lastclock'])})
-                        metrics_counter += 1
+            for metric in self.metrics_stream(host_id=host_id, chunk_size=chunk_size, cursor=cursor, store=store):
+                metrics.update({metrics_counter: metric})
+                metrics_counter += 1
 
         except Exception as ex:
             self.automation_exception(ex.message)
@@ -180,28 +315,240 @@ class ZabbixAutomation(ZabbixApi):
 
         return metrics
 
-    def problem_get(self, acknowledged=False):
+    def metrics_stream(self, host_id=None, chunk_size=500, cursor=None, store=None):
+
+        """
+        generator version of metrics_get, items are requested for chunk_size hosts
+        at once and host names are joined locally so every line is yielded as soon
+        as its chunk arrives. When a MetricsCursor is given only items whose lastclock
+        advanced since the previous export are yielded, the caller saves the cursor.
+        Numeric values yielded are also appended to store (a MetricsStore) when given,
+        the caller flushes it
+        """
+        hosts = self.host.get(output=['host', 'hostid', 'name'], hostids=host_id, filter={'available': 1})
+        if not hosts:
+            raise Exception("no host found or unavailable")
+        host_names = dict((host['hostid'], host['name']) for host in hosts)
+
+        def chunk_items(chunk):
+            return self.item.get(output=['itemid', 'hostid', 'key_', 'lastvalue',
+                                         'description', 'state', 'lastclock'],
+                                 hostids=[host['hostid'] for host in chunk])
+
+        for items in self.concurrent_imap(chunk_items, self.chunks(hosts, chunk_size)):
+            if items is None:
+                raise ValueError('No item found for host ' + str(host_id))
+            for item in items:
+                if cursor is not None and not cursor.advance(item['itemid'], item['lastclock']):
+                    continue
+                if store is not None and int(item['lastclock']):
+                    store.append(host_names[item['hostid']], item['key_'], item['itemid'], item['lastclock'],
+                                 item['lastvalue'])
+                yield '{}.{} {} {}'.format(host_names[item['hostid']], item['key_'],
+                                           item['lastvalue'], item['lastclock'])
+
+    def history_export(self, time_from, time_till, host_id=None, search_filter=None, window=3600, chunk_size=500,
+                       store=None):
+
+        """
+        stream history.get values between time_from and time_till (unix timestamps, both
+        included) as 'host.key value clock' lines. The range is split in windows of
+        window seconds and the items in chunks of chunk_size, every (window, chunk)
+        pair is one history.get run through concurrent_imap so only a bounded number
+        of responses is held in memory whatever the range size. Numeric values are
+        also appended to store when given, see metrics_stream
+        """
+        items = self.item.get(output=['itemid', 'key_', 'value_type'], hostids=host_id, search=search_filter,
+                              selectHosts={'output': ['name']})
+        names = {}
+        hosts_keys = {}
+        value_types = {}
+        for item in items:
+            names[item['itemid']] = '{}.{}'.format(item['hosts'][0]['name'], item['key_'])
+            hosts_keys[item['itemid']] = (item['hosts'][0]['name'], item['key_'])
+            value_types.setdefault(int(item['value_type']), []).append(item['itemid'])
+
+        def tasks():
+            for window_from in range(int(time_from), int(time_till) + 1, window):
+                window_till = min(window_from + window - 1, int(time_till))
+                for value_type, itemids in sorted(value_types.items()):
+                    for chunk in self.chunks(itemids, chunk_size):
+                        yield value_type, chunk, window_from, window_till
+
+        def fetch(task):
+            value_type, chunk, window_from, window_till = task
+            return self.history.get(output='extend', history=value_type, itemids=chunk,
+                                    time_from=window_from, time_till=window_till,
+                                    sortfield='clock', sortorder='ASC')
+
+        # only float and unsigned values go to the store
+        stored = set(value_types.get(0, []) + value_types.get(3, [])) if store is not None else set()
+        for values in self.concurrent_imap(fetch, tasks()):
+            for value in values:
+                if value['itemid'] in stored:
+                    host, key = hosts_keys[value['itemid']]
+                    store.append(host, key, value['itemid'], value['clock'], value['value'])
+                yield '{} {} {}'.format(names[value['itemid']], value['value'], value['clock'])
+
+    def trend_rollup(self, time_from, time_till, group_by='item', bucket=3600, host_id=None, search_filter=None,
+                     chunk_size=500, window=86400):
+
+        """
+        aggregate the trend.get hourly min/avg/max of numeric items between time_from and
+        time_till per item (host.key), host, key or host group in buckets of bucket seconds
+        and yield (name, clock, min, avg, max). Trends are fetched like history_export,
+        one trend.get per (window, chunk of items), and converted to TrendColumns by the
+        worker threads. Windows are rounded to whole buckets and the buckets of a window
+        are yielded as soon as all its chunks arrived, so memory is bounded by one window
+        of output plus the responses in flight
+        """
+        if group_by not in GROUP_BY:
+            raise ValueError('group_by must be one of {}'.format(', '.join(GROUP_BY)))
+
+        items = self.item.get(output=['itemid', 'hostid', 'key_', 'value_type'], hostids=host_id,
+                              search=search_filter, selectHosts={'output': ['name']})
+        # only float and unsigned items have trends
+        items = [item for item in items if int(item['value_type']) in (0, 3)]
+
+        host_groups = {}
+        if group_by == 'group':
+            hosts = self.host.get(output=['hostid'], hostids=list(set(item['hostid'] for item in items)),
+                                  selectGroups=['name'])
+            host_groups = dict((host['hostid'], [group['name'] for group in host['groups']]) for host in hosts)
+
+        labels = []
+        label_indexes = {}
+        item_labels = {}
+        for item in items:
+            host = item['hosts'][0]['name']
+            if group_by == 'item':
+                names = ['{}.{}'.format(host, item['key_'])]
+            elif group_by == 'host':
+                names = [host]
+            elif group_by == 'key':
+                names = [item['key_']]
+            else:
+                names = host_groups.get(item['hostid'], [])
+            indexes = []
+            for name in names:
+                if name not in label_indexes:
+                    label_indexes[name] = len(labels)
+                    labels.append(name)
+                indexes.append(label_indexes[name])
+            item_labels[int(item['itemid'])] = tuple(indexes)
+
+        rollup = TrendRollup(labels, item_labels, bucket)
+        itemids = sorted(item_labels)
+        window = max(bucket, window - window % bucket)
+        start = int(time_from) - int(time_from) % bucket
+
+        def tasks():
+            for window_from in range(start, int(time_till) + 1, window):
+                for chunk in self.chunks(itemids, chunk_size):
+                    yield window_from, chunk
+
+        def fetch(task):
+            window_from, chunk = task
+            trends = self.trend.get(output=['itemid', 'clock', 'num', 'value_min', 'value_avg', 'value_max'],
+                                    itemids=chunk, time_from=max(window_from, int(time_from)),
+                                    time_till=min(window_from + window - 1, int(time_till)))
+            return window_from, TrendColumns.from_trends(trends)
+
+        current = None
+        for window_from, columns in self.concurrent_imap(fetch, tasks()):
+            if window_from != current:
+                if current is not None:
+                    for row in rollup.rows():
+                        yield row
+                rollup.begin(window_from, min(window_from + window - 1, int(time_till)))
+                current = window_from
+            rollup.add(columns)
+        if current is not None:
+            for row in rollup.rows():
+                yield row
+
+    def problem_get(self, acknowledged=False, chunk_size=500):
 
         problems = {}
-        """ here we want to check for problem from zabbix triggers """
         problem_counter = 0
-        for problem in self.problem.get(output=['eventid', 'clock'], acknowledged=acknowledged):
-            status = {}
-            event = self.event.get(output=('acknowledged', 'hosts', 'clock'),
-                                   selectHosts=({'output': 'host'}),
-                                   selectRelatedObject=({'output': 'description'}),
-                                   filter=({'eventid': problem['eventid']}))
-
-            status.update({'hostname': event[0]['hosts'][0]['host']})
-            status.update({'acknowledged': event[0]['acknowledged']})
-            status.update({'description': event[0]['relatedObject']['description']})
-            status.update({'issued': problem['clock']})
+        for problem in self.problem_iter(acknowledged=acknowledged, chunk_size=chunk_size):
+            status = problem.to_dict()
+            # same fields as before the records, the eventid is only part of problem_iter
+            status.pop('eventid', None)
             problems.update({problem_counter: status})
             problem_counter += 1
 
         return problems
 
-    def create_action(self, alert_service, alert_script, action_template):
+    def problem_iter(self, acknowledged=False, chunk_size=500):
+
+        """
+        yield the open problems as ProblemRecord, the events of chunk_size
+        problems are requested with a single event.get
+        """
+        problem_list = self.problem.get(output=['eventid', 'clock'], acknowledged=acknowledged)
+
+        def chunk_events(chunk):
+            return chunk, self.event.get(output=('acknowledged', 'hosts', 'clock'),
+                                         selectHosts=({'output': 'host'}),
+                                         selectRelatedObject=({'output': 'description'}),
+                                         eventids=[problem['eventid'] for problem in chunk])
+
+        # one event.get per chunk of problems instead of one per problem
+        for chunk, events in self.concurrent_imap(chunk_events, self.chunks(problem_list, chunk_size)):
+            events_by_id = dict((event['eventid'], event) for event in events)
+
+            for problem in chunk:
+                event = events_by_id.get(problem['eventid'])
+                if event is None:
+                    # the event went away between the two calls
+                    continue
+                yield ProblemRecord({'eventid': problem['eventid'],
+                                     'hostname': event['hosts'][0]['host'],
+                                     'acknowledged': event['acknowledged'],
+                                     'description': event['relatedObject']['description'],
+                                     'issued': problem['clock']})
+
+    def event_watch(self, cursor, page_size=1000):
+
+        """
+        yield the trigger events newer than the high-water mark of cursor (an EventCursor)
+        as EventRecord, oldest first: transition is 'open' for a problem event and 'resolve'
+        for a recovery one, host and trigger description come joined by the same event.get.
+        Events are requested page_size at a time from the mark with eventid_from, so a poll
+        costs as much as the events happened since the previous one whatever the number of
+        open problems, page_size 0 fetches them with a single call. A cursor never used
+        is placed on the newest event and nothing is yielded. The mark follows the records
+        consumed, the caller saves the cursor
+        """
+        if cursor.eventid is None:
+            newest = self.event.get(output=['eventid'], source=0, object=0, sortfield='eventid', sortorder='DESC',
+                                    limit=1)
+            cursor.advance(newest[0]['eventid'] if newest else 0)
+            return
+
+        while True:
+            events = self.event.get(output=['eventid', 'value', 'objectid', 'acknowledged', 'clock'],
+                                    source=0, object=0, eventid_from=cursor.eventid + 1,
+                                    sortfield='eventid', sortorder='ASC', limit=page_size or None,
+                                    selectHosts=['host'],
+                                    selectRelatedObject=['description', 'priority'])
+            for event in events:
+                trigger = event.get('relatedObject') or {}
+                yield EventRecord({'eventid': event['eventid'],
+                                   'transition': 'open' if str(event['value']) == '1' else 'resolve',
+                                   # hosts and trigger are gone when the trigger was deleted since
+                                   'hostname': event['hosts'][0]['host'] if event.get('hosts') else None,
+                                   'triggerid': event['objectid'],
+                                   'description': trigger.get('description'),
+                                   'priority': trigger.get('priority'),
+                                   'acknowledged': event['acknowledged'],
+                                   'clock': event['clock']})
+                cursor.advance(event['eventid'])
+            if not page_size or len(events) < page_size:
+                return
+
+    def create_action(self, alert_service, alert_script, action_template, max_sessions=1):
 
         media_created = False
         group_created = False
@@ -234,7 +581,7 @@ class ZabbixAutomation(ZabbixApi):
                                               exec_path=alert_script,
                                               status=0,
                                               exec_params=alert_service + "\n{ALERT.SUBJECT}\n{ALERT.MESSAGE}\n",
-                                              maxsessions=1,
+                                              maxsessions=max_sessions,
                                               maxattempts=3,
                                               attempt_interval="10s"
                                               )['mediatypeids'][0]
@@ -310,6 +657,11 @@ class ZabbixAutomation(ZabbixApi):
             return True
         return False
 
+    @staticmethod
+    def chunks(sequence, size):
+        for start in range(0, len(sequence), size):
+            yield sequence[start:start + size]
+
     @staticmethod
     def automation_exception(exception):
         print('\033[91m[ERROR]:  {} \033[0m'.format(exception))
@@ -0,0 +1,135 @@
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ZabbixCache(object):
+    """
+    read-through cache for slow changing zabbix objects. Only the methods listed in
+    ttl are cached, each one with its own time to live in seconds, and the cache never
+    holds more than size answers: the least recently used one is evicted first.
+    Any write call (create, update, delete, ...) on an object drops the cached answers
+    of that object and of the objects depending on it
+    """
+
+    DEFAULT_TTL = {
+        'apiinfo.version': 3600,
+        'host.get': 300,
+        'hostinterface.get': 300,
+        'item.get': 300,
+    }
+
+    # writing an object changes what is returned by these other objects
+    DEPENDENCIES = {
+        'host': ('hostinterface', 'item'),
+        'hostinterface': ('host',),
+        'template': ('host', 'item'),
+    }
+
+    # item fields updated at every check, answers containing them are never cached
+    VOLATILE_ITEM_FIELDS = ('lastvalue', 'lastclock', 'lastns', 'prevvalue', 'state', 'error')
+
+    READ_METHODS = ('get', 'version')
+
+    def __init__(self, size=1024, ttl=None):
+        self.size = size
+        self.ttl = dict(self.DEFAULT_TTL)
+        if ttl is not None:
+            self.ttl.update(ttl)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # bumped by every write, answers read across a write are not cached
+        self.generation = 0
+
+    def cacheable(self, method, params):
+        if method not in self.ttl:
+            return False
+        if method == 'item.get':
+            if not isinstance(params, dict):
+                return False
+            output = params.get('output')
+            if output is None or output == 'extend':
+                return False
+            if isinstance(output, (list, tuple)):
+                return not any(field in self.VOLATILE_ITEM_FIELDS for field in output)
+        return True
+
+    @staticmethod
+    def key(method, params):
+        return json.dumps([method, params], sort_keys=True)
+
+    def get(self, method, params):
+
+        """
+        return (True, value) on hit or (False, None) on miss, the returned value
+        is a copy so callers are free to modify it
+        """
+        key = self.key(method, params)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return False, None
+            # move the entry to the most recently used end
+            del self.entries[key]
+            self.entries[key] = entry
+            self.hits += 1
+            value = entry[2]
+        return True, copy.deepcopy(value)
+
+    def put(self, method, params, value, generation=None):
+
+        """
+        store an answer, generation is the one read before the request was sent:
+        if a write was invalidated meanwhile the answer may predate it and is dropped
+        """
+        key = self.key(method, params)
+        expire = time.time() + self.ttl[method]
+        value = copy.deepcopy(value)
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self.entries:
+                del self.entries[key]
+            self.entries[key] = (expire, method, value)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, method):
+
+        """
+        called for every api method sent, read methods are ignored while writes
+        drop every cached answer of the written object and of its dependents
+        """
+        zbobj, _, action = method.partition('.')
+        if action in self.READ_METHODS:
+            return
+        objects = (zbobj,) + self.DEPENDENCIES.get(zbobj, ())
+        with self.lock:
+            self.generation += 1
+            for key, entry in list(self.entries.items()):
+                if entry[1].partition('.')[0] in objects:
+                    del self.entries[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'entries': len(self.entries),
+                    'size': self.size}
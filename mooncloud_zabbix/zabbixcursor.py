@@ -0,0 +1,151 @@
+import os
+import struct
+import tempfile
+from array import array
+
+
+class MetricsCursor(object):
+    """
+    last exported clock of every item, used by metrics_stream to emit only the
+    values that advanced since the previous run. The cursor is stored as a small
+    header followed by two native unsigned long arrays (itemids and clocks) so loading
+    and saving hundreds of thousands of items is a single read/write each.
+    The file is replaced atomically: a crash leaves either the old or the new cursor
+    """
+
+    MAGIC = 'ZBXC'
+    VERSION = 1
+    HEADER = struct.Struct('<4sBBQ')
+
+    def __init__(self, path):
+        self.path = path
+        self.clocks = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        self.clocks = {}
+        try:
+            cursor_file = open(self.path, 'rb')
+        except IOError:
+            return
+
+        with cursor_file:
+            header = cursor_file.read(self.HEADER.size)
+            if len(header) != self.HEADER.size:
+                return
+            magic, version, itemsize, count = self.HEADER.unpack(header)
+            itemids = array('L')
+            clocks = array('L')
+            if magic != self.MAGIC or version != self.VERSION or itemsize != itemids.itemsize:
+                print('\033[91m[ERROR]: ignoring incompatible cursor {}\033[0m'.format(self.path))
+                return
+            try:
+                itemids.fromfile(cursor_file, count)
+                clocks.fromfile(cursor_file, count)
+            except EOFError:
+                print('\033[91m[ERROR]: ignoring truncated cursor {}\033[0m'.format(self.path))
+                return
+        self.clocks = dict(zip(itemids, clocks))
+
+    def advance(self, itemid, clock):
+
+        """
+        record clock for itemid and return True only if it is newer than the
+        one already exported
+        """
+        itemid = int(itemid)
+        clock = int(clock)
+        if clock <= self.clocks.get(itemid, -1):
+            return False
+        self.clocks[itemid] = clock
+        self.changed = True
+        return True
+
+    def save(self):
+        if not self.changed:
+            return
+        itemids = array('L', self.clocks.keys())
+        clocks = array('L', self.clocks.values())
+
+        def write(cursor_file):
+            cursor_file.write(self.HEADER.pack(self.MAGIC, self.VERSION, itemids.itemsize, len(itemids)))
+            itemids.tofile(cursor_file)
+            clocks.tofile(cursor_file)
+
+        replace_file(self.path, write)
+        self.changed = False
+
+    def __len__(self):
+        return len(self.clocks)
+
+
+class EventCursor(object):
+    """
+    high-water mark of event_watch: the highest eventid already emitted, stored
+    in a fixed size record replaced atomically like MetricsCursor. eventid is None
+    until the first poll places the mark on the newest event
+    """
+
+    MAGIC = 'ZBXE'
+    VERSION = 1
+    RECORD = struct.Struct('<4sBQ')
+
+    def __init__(self, path):
+        self.path = path
+        self.eventid = None
+        self.changed = False
+        self.load()
+
+    def load(self):
+        self.eventid = None
+        try:
+            with open(self.path, 'rb') as cursor_file:
+                record = cursor_file.read(self.RECORD.size)
+        except IOError:
+            return
+        if len(record) != self.RECORD.size:
+            print('\033[91m[ERROR]: ignoring truncated cursor {}\033[0m'.format(self.path))
+            return
+        magic, version, eventid = self.RECORD.unpack(record)
+        if magic != self.MAGIC or version != self.VERSION:
+            print('\033[91m[ERROR]: ignoring incompatible cursor {}\033[0m'.format(self.path))
+            return
+        self.eventid = eventid
+
+    def advance(self, eventid):
+        eventid = int(eventid)
+        if self.eventid is None or eventid > self.eventid:
+            self.eventid = eventid
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        replace_file(self.path, lambda cursor_file: cursor_file.write(self.RECORD.pack(self.MAGIC, self.VERSION,
+                                                                                       self.eventid)))
+        self.changed = False
+
+
+def replace_file(path, write):
+
+    """
+    call write(file) on a temporary file next to path and rename it over path
+    once synced, a crash leaves either the old or the new content
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cursor')
+    try:
+        with os.fdopen(fd, 'wb') as cursor_file:
+            write(cursor_file)
+            cursor_file.flush()
+            os.fsync(cursor_file.fileno())
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
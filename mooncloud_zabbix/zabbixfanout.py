@@ -0,0 +1,145 @@
+import time
+import threading
+from Queue import Queue, Empty, Full
+from zabbixautomation import ZabbixAutomation
+from zabbixcache import ZabbixCache
+
+# kinds of the messages sent by the server threads
+RECORD = 0
+FAILED = 1
+DONE = 2
+
+
+class ZabbixFanout(object):
+    """
+    run the same ZabbixAutomation query against several zabbix servers at once.
+    Every server is queried by its own thread with its own session, records are
+    merged in a single stream as soon as they arrive and tagged with the name of the
+    server they come from. A server failing or exceeding its deadline (seconds allowed
+    for the whole query) is recorded in errors and dropped without delaying the others
+    """
+    def __init__(self, servers, automation_prefix, deadline=None, cache_settings=None, queue_size=1000,
+                 **api_settings):
+        self.deadline = deadline
+        self.queue_size = queue_size
+        self.errors = {}
+        self.servers = []
+        for server in servers:
+            settings = dict(api_settings)
+            if 'timeout' in server:
+                settings['timeout'] = server['timeout']
+            if cache_settings is not None:
+                # cache keys don't include the server, every session needs its own
+                settings['cache'] = ZabbixCache(size=cache_settings.get('size', 1024), ttl=cache_settings.get('ttl'))
+            # limits and failures are tracked per server as well
+            for key in ('limiter', 'circuit_breaker'):
+                if settings.get(key) is not None:
+                    settings[key] = settings[key].clone()
+            session = ZabbixAutomation(url=server['zabbix_url'], automation_prefix=automation_prefix, **settings)
+            self.servers.append((server['name'], server, session))
+
+    def login(self):
+
+        """
+        log into every server, return the names of the servers logged in. Servers
+        failing to log in are left out of the following queries
+        """
+        logged = set(name for name, success in self.fan_out(
+            lambda server, session: [session.login(username=server['zabbix_username'],
+                                                   password=server['zabbix_password'])]) if success)
+        for name, server, session in self.servers:
+            if name not in logged:
+                self.errors.setdefault(name, 'login failed')
+        self.servers = [(name, server, session) for name, server, session in self.servers if name in logged]
+        return logged
+
+    def logout(self):
+        return dict(self.fan_out(lambda server, session: [session.logout()]))
+
+    def close(self):
+        for name, server, session in self.servers:
+            session.close()
+
+    def query(self, method, *args, **kwargs):
+
+        """
+        yield (server name, record) for every record produced by the ZabbixAutomation
+        generator method (host_iter, item_iter, interface_iter, problem_iter,
+        metrics_stream, history_export) called with args on every server
+        """
+        return self.fan_out(lambda server, session: getattr(session, method)(*args, **kwargs))
+
+    def fan_out(self, query):
+
+        """
+        call query(server, session) on every server in its own thread and yield
+        (server name, record) for every element of the iterables returned, in
+        arrival order. The queue between the threads and the caller is bounded so
+        a slow consumer holds back the producers instead of buffering everything
+        """
+        queue = Queue(self.queue_size)
+        abandoned = set()
+
+        def put(name, message):
+            # never block forever on a consumer that gave up on this server
+            while name not in abandoned:
+                try:
+                    queue.put(message, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def worker(name, server, session):
+            try:
+                for record in query(server, session):
+                    if not put(name, (name, RECORD, record)):
+                        return
+            except Exception as ex:
+                put(name, (name, FAILED, ex))
+            else:
+                put(name, (name, DONE, None))
+
+        started = time.time()
+        deadlines = {}
+        for name, server, session in self.servers:
+            deadline = server.get('query_timeout', self.deadline)
+            deadlines[name] = started + deadline if deadline else None
+            thread = threading.Thread(target=worker, args=(name, server, session), name='fanout-' + name)
+            thread.daemon = True
+            thread.start()
+
+        pending = set(deadlines)
+        try:
+            while pending:
+                now = time.time()
+                for name in sorted(pending):
+                    if deadlines[name] is not None and now >= deadlines[name]:
+                        pending.discard(name)
+                        abandoned.add(name)
+                        self.fail(name, 'no complete answer after {:.1f}s'.format(now - started))
+                if not pending:
+                    break
+                # wake up at the next deadline, and at least every second so
+                # KeyboardInterrupt is not delayed by a blocking get
+                wait = min([deadlines[name] - now for name in pending if deadlines[name] is not None] + [1.0])
+                try:
+                    name, kind, payload = queue.get(timeout=max(wait, 0.01))
+                except Empty:
+                    continue
+                if name not in pending:
+                    continue
+                if kind == RECORD:
+                    yield name, payload
+                elif kind == FAILED:
+                    pending.discard(name)
+                    self.fail(name, payload)
+                else:
+                    pending.discard(name)
+        finally:
+            # release the threads still producing when the caller stops early
+            abandoned.update(deadlines)
+
+    def fail(self, name, error):
+        self.errors[name] = str(error)
+        ZabbixAutomation.automation_exception('{}: {}'.format(name, error))
@@ -0,0 +1,137 @@
+import re
+import json
+import importlib
+
+# characters changing the parser state outside and inside json strings
+STRUCTURAL = re.compile(r'["\[\]{},]')
+STRING_SPECIAL = re.compile(r'["\\]')
+SEPARATORS = re.compile(r'[\s,]*')
+WHITESPACE = re.compile(r'\s*')
+
+
+def json_backend(name='json'):
+
+    """
+    return the loads function of the requested json module, ujson and simplejson
+    are optional and fall back to the standard library when not installed
+    """
+    if name in (None, 'json'):
+        return json.loads
+    try:
+        return importlib.import_module(name).loads
+    except ImportError:
+        print('\033[91m[ERROR]: json backend {} not available, using json\033[0m'.format(name))
+        return json.loads
+
+
+class ResultStreamDecoder(object):
+    """
+    incremental decoder of a json-rpc response: feed it the body chunk by chunk and
+    it returns the elements of the top level "result" array as soon as each one is
+    complete, without ever holding the whole document. Inside the array every element
+    is decoded by the C json scanner (raw_decode), an element cut by the end of a chunk
+    is retried once more data arrived. Outside of it structural characters are located
+    with regular expressions to find the "result" key.
+    Responses without a result array (errors, scalar or object results) are small and
+    are buffered whole, finish() decodes them
+    """
+    def __init__(self, loads=json.loads):
+        self.loads = loads
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.string_start = None
+        self.last_key = None
+        self.in_result = False
+        self.result_done = False
+
+    def feed(self, chunk):
+        buf = self.buffer + chunk
+        pos = self.pos
+        elements = []
+
+        while True:
+            if self.in_result:
+                pos = SEPARATORS.match(buf, pos).end()
+                if pos >= len(buf):
+                    break
+                if buf[pos] == ']':
+                    pos += 1
+                    self.depth -= 1
+                    self.in_result = False
+                    self.result_done = True
+                    continue
+                try:
+                    element, end = self.decoder.raw_decode(buf, pos)
+                except ValueError:
+                    # incomplete element, wait for the next chunk
+                    break
+                # an element is complete only once the following separator is seen,
+                # a number cut in a chunk (e.g. "12" of "12.5") decodes fine otherwise
+                following = WHITESPACE.match(buf, end).end()
+                if following >= len(buf):
+                    break
+                if buf[following] not in ',]':
+                    if isinstance(element, (int, long, float)) and not isinstance(element, bool):
+                        break
+                    raise ValueError('invalid json-rpc response near {!r}'.format(buf[following:following + 20]))
+                elements.append(element)
+                pos = end
+                continue
+
+            if self.in_string:
+                match = STRING_SPECIAL.search(buf, pos)
+                if match is None:
+                    # pos may already point past an escaped character still to come
+                    pos = max(pos, len(buf))
+                    break
+                if match.group() == '\\':
+                    # skip the escaped character, even if it is in the next chunk
+                    pos = match.end() + 1
+                    continue
+                self.in_string = False
+                pos = match.end()
+                if self.depth == 1:
+                    self.last_key = buf[self.string_start + 1:match.start()]
+                continue
+
+            match = STRUCTURAL.search(buf, pos)
+            if match is None:
+                pos = len(buf)
+                break
+            char = match.group()
+            pos = match.end()
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = match.start()
+            elif char in '[{':
+                if char == '[' and self.depth == 1 and self.last_key == 'result' and not self.result_done:
+                    self.in_result = True
+                self.depth += 1
+            elif char in ']}':
+                self.depth -= 1
+
+        # drop what has already been decoded, the buffer is kept whole until
+        # the result array is found in case there is none
+        keep = min(pos, len(buf)) if self.in_result or self.result_done else 0
+        self.buffer = buf[keep:]
+        self.pos = pos - keep
+        if self.string_start is not None:
+            self.string_start -= keep
+        return elements
+
+    def finish(self):
+
+        """
+        return the whole decoded response when no result array was streamed,
+        None otherwise
+        """
+        if self.in_result:
+            # every element is followed at least by the closing bracket
+            raise ValueError('truncated json-rpc response')
+        if self.result_done:
+            return None
+        return self.loads(self.buffer)
@@ -0,0 +1,83 @@
+import random
+import sys
+import time
+
+
+class ZabbixPoller(object):
+    """
+    run a set of collection tasks every interval seconds on an already logged in
+    session. Each cycle is delayed by a random jitter (0..jitter seconds) so many
+    pollers don't hit the frontend at the same instant. The start delay compared to
+    the schedule (drift) is reported for every cycle and a cycle lasting longer than
+    interval is reported as an overrun, the cycles it covered are skipped instead of
+    being run back to back
+    """
+    def __init__(self, tasks, interval, jitter=0, verbose=False, report=None):
+        self.tasks = tasks
+        self.interval = interval
+        self.jitter = jitter
+        self.verbose = verbose
+        self.report = report or self.print_report
+        self.running = False
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.errors = 0
+        self.max_drift = 0.0
+
+    def stop(self, *args):
+        self.running = False
+
+    def run(self, cycles=None):
+        self.running = True
+        schedule = time.time()
+        while self.running and (cycles is None or self.cycles < cycles):
+            delay = schedule + random.uniform(0, self.jitter) - time.time()
+            if delay > 0:
+                self.sleep(delay)
+                if not self.running:
+                    break
+
+            started = time.time()
+            drift = started - schedule
+            self.max_drift = max(self.max_drift, drift)
+            for name, task in self.tasks:
+                try:
+                    task()
+                except Exception as ex:
+                    self.errors += 1
+                    self.report('\033[91m[ERROR]: task {} failed: {}\033[0m'.format(name, ex))
+            duration = time.time() - started
+            self.cycles += 1
+
+            if self.verbose:
+                self.report('[POLLER] cycle {} drift {:.3f}s duration {:.3f}s'.format(self.cycles, drift, duration))
+
+            schedule += self.interval
+            if time.time() > schedule:
+                missed = int((time.time() - schedule) // self.interval) + 1
+                self.overruns += 1
+                self.skipped += missed
+                self.report('\033[93m[WARNING]: cycle {} took {:.3f}s, longer than the {}s interval, '
+                            '{} cycle(s) skipped\033[0m'.format(self.cycles, duration, self.interval, missed))
+                schedule += missed * self.interval
+
+    def sleep(self, seconds):
+        # short naps so a stop request is honoured quickly
+        deadline = time.time() + seconds
+        while self.running:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 1))
+
+    def stats(self):
+        return {'cycles': self.cycles,
+                'overruns': self.overruns,
+                'skipped': self.skipped,
+                'errors': self.errors,
+                'max_drift': self.max_drift}
+
+    @staticmethod
+    def print_report(message):
+        sys.stderr.write(message + '\n')
@@ -0,0 +1,63 @@
+class Record(object):
+    """
+    compact record built from an api object: the usual fields live in slots instead
+    of a per-object dict and anything else the api returned (output='extend', select*
+    options) is kept in extra. to_dict() gives back the plain object for json output
+    """
+    __slots__ = ('extra',)
+    FIELDS = ()
+
+    def __init__(self, values):
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+        extra = dict((key, value) for key, value in values.items() if key not in self.FIELDS)
+        self.extra = extra or None
+
+    def to_dict(self):
+        values = dict((field, getattr(self, field)) for field in self.FIELDS if getattr(self, field) is not None)
+        if self.extra:
+            values.update(self.extra)
+        return values
+
+    def __getitem__(self, field):
+        # lets records be used where api dicts were expected
+        if field in self.FIELDS:
+            return getattr(self, field)
+        if self.extra and field in self.extra:
+            return self.extra[field]
+        raise KeyError(field)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.to_dict())
+
+
+class HostRecord(Record):
+    FIELDS = ('hostid', 'host', 'name', 'available', 'status')
+    __slots__ = FIELDS
+
+
+class ItemRecord(Record):
+    FIELDS = ('itemid', 'hostid', 'name', 'key_', 'description', 'type', 'value_type', 'delay', 'state',
+              'lastvalue', 'lastclock')
+    __slots__ = FIELDS
+
+
+class InterfaceRecord(Record):
+    FIELDS = ('interfaceid', 'hostid', 'main', 'type', 'useip', 'ip', 'dns', 'port')
+    __slots__ = FIELDS
+
+
+class ProblemRecord(Record):
+    FIELDS = ('eventid', 'hostname', 'acknowledged', 'description', 'issued')
+    __slots__ = FIELDS
+
+
+class EventRecord(Record):
+    FIELDS = ('eventid', 'transition', 'hostname', 'triggerid', 'description', 'priority', 'acknowledged', 'clock')
+    __slots__ = FIELDS
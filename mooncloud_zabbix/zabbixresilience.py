@@ -0,0 +1,122 @@
+import time
+import threading
+from zabbixapi_exception import ZabbixCircuitOpen
+
+
+class AdaptiveLimiter(object):
+    """
+    bound the api calls in flight with an AIMD limit: every call answered in time
+    raises the limit by 1/limit (about +1 per round of limit calls), a transport error
+    or a call slower than tolerance times the usual latency of its method multiplies
+    it by backoff, at most once per round trip since the calls already in flight were
+    sent with the old limit. The usual latency is the lowest observed for the method,
+    drifting slowly up so a server that became permanently slower is not penalized
+    forever; latencies under latency_floor seconds never count as slow.
+    With latency_target set a call is slow when it takes longer than that instead
+    """
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_target=None, tolerance=2.0, backoff=0.7,
+                 latency_floor=0.1):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(max(self.minimum, min(initial, self.maximum)))
+        self.latency_target = latency_target
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.latency_floor = latency_floor
+        self.baselines = {}
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self.condition = threading.Condition()
+
+    def clone(self):
+        return AdaptiveLimiter(initial=self.limit, minimum=self.minimum, maximum=self.maximum,
+                               latency_target=self.latency_target, tolerance=self.tolerance, backoff=self.backoff,
+                               latency_floor=self.latency_floor)
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, method, latency, failed):
+        with self.condition:
+            self.in_flight -= 1
+            if failed:
+                overloaded = True
+            else:
+                baseline = self.baselines.get(method)
+                if baseline is None or latency < baseline:
+                    baseline = latency
+                else:
+                    baseline += (latency - baseline) * 0.01
+                self.baselines[method] = baseline
+                threshold = self.latency_target or max(baseline * self.tolerance, self.latency_floor)
+                overloaded = latency > threshold
+
+            now = time.time()
+            if not overloaded:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self.increases += 1
+            elif now - self.last_decrease >= latency:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self.last_decrease = now
+                self.decreases += 1
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {'limit': self.limit, 'in_flight': self.in_flight,
+                    'increases': self.increases, 'decreases': self.decreases}
+
+
+class CircuitBreaker(object):
+    """
+    fail fast while the server is unhealthy: after failures consecutive transport
+    errors the circuit opens and every call raises ZabbixCircuitOpen without touching
+    the network. Once reset_timeout seconds passed a single call is let through as a
+    probe (half open), its success closes the circuit, its failure opens it again
+    """
+    def __init__(self, failures=5, reset_timeout=30):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened = None
+        self.probing = False
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    def clone(self):
+        return CircuitBreaker(failures=self.failures, reset_timeout=self.reset_timeout)
+
+    def before_call(self):
+        with self.lock:
+            if self.opened is None:
+                return
+            remaining = self.opened + self.reset_timeout - time.time()
+            if remaining > 0 or self.probing:
+                raise ZabbixCircuitOpen('circuit open after {} consecutive failures, next attempt in {:.1f}s'
+                                        .format(self.consecutive_failures, max(remaining, 0)))
+            self.probing = True
+
+    def success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.opened = None
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.probing or (self.opened is None and self.consecutive_failures >= self.failures):
+                if not self.probing:
+                    self.trips += 1
+                self.opened = time.time()
+                self.probing = False
+
+    def stats(self):
+        with self.lock:
+            return {'state': 'closed' if self.opened is None else 'half-open' if self.probing else 'open',
+                    'consecutive_failures': self.consecutive_failures, 'trips': self.trips}
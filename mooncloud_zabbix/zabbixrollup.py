@@ -0,0 +1,173 @@
+from array import array
+from itertools import izip
+from operator import itemgetter
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+GROUP_BY = ('item', 'host', 'key', 'group')
+
+INFINITY = float('inf')
+
+
+class TrendColumns(object):
+    """
+    trend.get rows stored column wise in native arrays (itemid, clock, num, min,
+    avg, max), about 48 bytes per row instead of a dict of strings. The arrays are
+    filled with map() so the conversion runs at C speed and numpy, when installed,
+    reads them in place with frombuffer
+    """
+    def __init__(self, itemid=None, clock=None, num=None, value_min=None, value_avg=None, value_max=None):
+        self.itemid = itemid or array('L')
+        self.clock = clock or array('l')
+        self.num = num or array('l')
+        self.min = value_min or array('d')
+        self.avg = value_avg or array('d')
+        self.max = value_max or array('d')
+
+    def __len__(self):
+        return len(self.itemid)
+
+    @classmethod
+    def from_trends(cls, trends):
+        if trends and 'num' not in trends[0]:
+            num = array('l', [1]) * len(trends)
+        else:
+            num = array('l', map(int, map(itemgetter('num'), trends)))
+        return cls(itemid=array('L', map(int, map(itemgetter('itemid'), trends))),
+                   clock=array('l', map(int, map(itemgetter('clock'), trends))),
+                   num=num,
+                   value_min=array('d', map(float, map(itemgetter('value_min'), trends))),
+                   value_avg=array('d', map(float, map(itemgetter('value_avg'), trends))),
+                   value_max=array('d', map(float, map(itemgetter('value_max'), trends))))
+
+
+class TrendRollup(object):
+    """
+    min, average (weighted by the number of values of every trend row) and max of
+    trend rows grouped by label and by buckets of bucket seconds aligned on the
+    epoch. labels are the group names, item_labels maps every itemid to the indexes
+    of the labels it counts for (one, or several for the host groups of its host).
+    Accumulators are dense arrays of labels x buckets cells for the range given to
+    begin(), so memory depends on the output size only, never on the rows added.
+    With numpy every added block is reduced with sort + reduceat, otherwise a plain
+    loop updates the same arrays
+    """
+    def __init__(self, labels, item_labels, bucket=3600):
+        self.labels = labels
+        self.item_labels = item_labels
+        self.bucket = bucket
+        self.start = 0
+        self.buckets = 0
+        self.acc_min = self.acc_max = self.acc_sum = self.acc_num = None
+        if numpy is not None:
+            # itemid -> row of label indexes padded with -1, looked up with searchsorted
+            self.item_keys = numpy.array(sorted(item_labels), dtype=numpy.uint64)
+            slots = max([len(indexes) for indexes in item_labels.values()] + [1])
+            self.label_table = numpy.full((len(self.item_keys), slots), -1, dtype=numpy.int64)
+            for position, itemid in enumerate(self.item_keys.tolist()):
+                indexes = item_labels[itemid]
+                self.label_table[position, :len(indexes)] = indexes
+
+    def begin(self, time_from, time_till):
+        self.start = time_from - time_from % self.bucket
+        self.buckets = (time_till - self.start) // self.bucket + 1
+        size = self.buckets * len(self.labels)
+        if numpy is not None:
+            self.acc_min = numpy.full(size, INFINITY)
+            self.acc_max = numpy.full(size, -INFINITY)
+            self.acc_sum = numpy.zeros(size)
+            self.acc_num = numpy.zeros(size)
+        else:
+            self.acc_min = array('d', [INFINITY]) * size
+            self.acc_max = array('d', [-INFINITY]) * size
+            self.acc_sum = array('d', [0.0]) * size
+            self.acc_num = array('d', [0.0]) * size
+
+    def add(self, columns):
+        if not len(columns):
+            return
+        if numpy is not None:
+            self.add_vectorized(columns)
+        else:
+            self.add_rows(columns)
+
+    def add_vectorized(self, columns):
+        itemid = numpy.frombuffer(columns.itemid, dtype=columns.itemid.typecode).astype(numpy.uint64)
+        clock = numpy.frombuffer(columns.clock, dtype=columns.clock.typecode)
+        num = numpy.frombuffer(columns.num, dtype=columns.num.typecode).astype(numpy.float64)
+        value_min = numpy.frombuffer(columns.min, dtype='d')
+        value_max = numpy.frombuffer(columns.max, dtype='d')
+        weighted = numpy.frombuffer(columns.avg, dtype='d') * num
+        if not len(self.item_keys):
+            return
+
+        position = numpy.minimum(numpy.searchsorted(self.item_keys, itemid), len(self.item_keys) - 1)
+        bucket = (clock - self.start) // self.bucket
+        valid = (self.item_keys[position] == itemid) & (bucket >= 0) & (bucket < self.buckets)
+        for slot in range(self.label_table.shape[1]):
+            label = self.label_table[position, slot]
+            mask = valid & (label >= 0)
+            if not mask.any():
+                continue
+            cell = bucket[mask] * len(self.labels) + label[mask]
+            order = numpy.argsort(cell, kind='mergesort')
+            cell = cell[order]
+            starts = numpy.flatnonzero(numpy.concatenate(([True], cell[1:] != cell[:-1])))
+            cells = cell[starts]
+            self.acc_min[cells] = numpy.minimum(self.acc_min[cells],
+                                                numpy.minimum.reduceat(value_min[mask][order], starts))
+            self.acc_max[cells] = numpy.maximum(self.acc_max[cells],
+                                                numpy.maximum.reduceat(value_max[mask][order], starts))
+            self.acc_sum[cells] += numpy.add.reduceat(weighted[mask][order], starts)
+            self.acc_num[cells] += numpy.add.reduceat(num[mask][order], starts)
+
+    def add_rows(self, columns):
+        labels = len(self.labels)
+        acc_min, acc_max, acc_sum, acc_num = self.acc_min, self.acc_max, self.acc_sum, self.acc_num
+        for itemid, clock, num, value_min, value_avg, value_max in izip(columns.itemid, columns.clock, columns.num,
+                                                                        columns.min, columns.avg, columns.max):
+            indexes = self.item_labels.get(itemid)
+            bucket = (clock - self.start) // self.bucket
+            if not indexes or not 0 <= bucket < self.buckets:
+                continue
+            for label in indexes:
+                cell = bucket * labels + label
+                if value_min < acc_min[cell]:
+                    acc_min[cell] = value_min
+                if value_max > acc_max[cell]:
+                    acc_max[cell] = value_max
+                acc_sum[cell] += value_avg * num
+                acc_num[cell] += num
+
+    def rows(self):
+
+        """
+        yield (label, bucket clock, min, avg, max) of every cell that received
+        data, ordered by clock then label
+        """
+        labels = len(self.labels)
+        if numpy is not None:
+            filled = numpy.flatnonzero(self.acc_num > 0)
+            cells = izip(filled.tolist(), self.acc_min[filled].tolist(), self.acc_max[filled].tolist(),
+                         self.acc_sum[filled].tolist(), self.acc_num[filled].tolist())
+        else:
+            cells = ((cell, self.acc_min[cell], self.acc_max[cell], self.acc_sum[cell], self.acc_num[cell])
+                     for cell in xrange(len(self.acc_num)) if self.acc_num[cell] > 0)
+        for cell, value_min, value_max, value_sum, value_num in cells:
+            bucket, label = divmod(cell, labels)
+            yield (self.labels[label], self.start + bucket * self.bucket, value_min, value_sum / value_num,
+                   value_max)
+
+
+def tsdb_lines(rows):
+
+    """
+    format rollup rows as 'name.min value clock' lines, three per row,
+    like the ones written by metrics_stream and history_export
+    """
+    for name, clock, value_min, value_avg, value_max in rows:
+        yield '{}.min {!r} {}'.format(name, value_min, clock)
+        yield '{}.avg {!r} {}'.format(name, value_avg, clock)
+        yield '{}.max {!r} {}'.format(name, value_max, clock)
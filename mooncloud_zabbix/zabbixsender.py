@@ -0,0 +1,212 @@
+import re
+import json
+import time
+import zlib
+import select
+import socket
+import struct
+from itertools import islice
+from zabbixapi_exception import ZabbixSenderError
+from zabbixapi_exception import ZabbixTransportError
+
+# item type whose values are pushed to the trapper instead of polled
+TRAPPER = 2
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class ZabbixSender(object):
+    """
+    push values to the trapper port of a zabbix server or proxy with the protocol of
+    zabbix_sender. Every frame is the 'ZBXD' signature, a flags byte and two little
+    endian uint32 (data length and, when compressed, uncompressed length; the same
+    8 bytes older servers read as a uint64 length) followed by a 'sender data' json
+    request of up to batch_size values. The connection is kept open between frames
+    and opened again once the other side closed it, the server answers every frame
+    with how many values it processed and how many it refused (unknown host or key,
+    item not a trapper, value of the wrong type)
+    """
+
+    HEADER = struct.Struct('<4sBII')
+    SIGNATURE = 'ZBXD'
+    FLAG_PROTOCOL = 0x01
+    FLAG_COMPRESSED = 0x02
+    MAX_RESPONSE = 16 * 1024 * 1024
+    INFO = re.compile(r'processed:\s*(\d+);\s*failed:\s*(\d+)')
+
+    def __init__(self, server, port=10051, timeout=7, batch_size=1000, compression=False):
+        self.server = server
+        self.port = port
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.compression = compression
+        self.sock = None
+        self.connections = 0
+
+    def connect(self):
+        try:
+            self.sock = socket.create_connection((self.server, self.port), self.timeout)
+        except socket.error as ex:
+            raise ZabbixTransportError('cannot connect to trapper {}:{}: {}'.format(self.server, self.port, ex))
+        self.connections += 1
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def connected(self):
+
+        """
+        True if the connection can carry another frame: nothing may be readable on
+        an idle connection, a readable socket was closed by the server (which zabbix
+        does after every answer) or holds garbage
+        """
+        if self.sock is None:
+            return False
+        try:
+            readable, writable, failed = select.select([self.sock], [], [], 0)
+        except (select.error, socket.error):
+            readable = True
+        if readable:
+            self.close()
+            return False
+        return True
+
+    def frame(self, request):
+        data = json.dumps(request, separators=(',', ':'))
+        if self.compression:
+            compressed = zlib.compress(data)
+            return self.HEADER.pack(self.SIGNATURE, self.FLAG_PROTOCOL | self.FLAG_COMPRESSED, len(compressed),
+                                    len(data)) + compressed
+        return self.HEADER.pack(self.SIGNATURE, self.FLAG_PROTOCOL, len(data), 0) + data
+
+    def read(self, size):
+        chunks = []
+        while size:
+            chunk = self.sock.recv(min(size, 65536))
+            if not chunk:
+                raise ConnectionClosed('connection closed by {}:{}'.format(self.server, self.port))
+            chunks.append(chunk)
+            size -= len(chunk)
+        return ''.join(chunks)
+
+    def receive(self, received=''):
+
+        """
+        read the rest of an answer whose first bytes were received and decode it
+        """
+        header = received + self.read(self.HEADER.size - len(received))
+        signature, flags, length, uncompressed = self.HEADER.unpack(header)
+        if signature != self.SIGNATURE or not flags & self.FLAG_PROTOCOL:
+            raise ZabbixSenderError('unexpected answer from {}:{}'.format(self.server, self.port))
+        if length > self.MAX_RESPONSE:
+            raise ZabbixSenderError('answer of {} bytes from {}:{} refused'.format(length, self.server, self.port))
+        data = self.read(length)
+        if flags & self.FLAG_COMPRESSED:
+            data = zlib.decompress(data)
+        try:
+            return json.loads(data)
+        except ValueError:
+            raise ZabbixSenderError('invalid answer from {}:{}: {!r}'.format(self.server, self.port, data[:200]))
+
+    def exchange(self, frame):
+
+        """
+        send a frame and return the decoded answer. A connection kept from a previous
+        frame may have been closed in the meantime: when it fails before any byte of
+        the answer arrived the frame is sent once more on a new connection. Timeouts
+        are never retried, the server may have stored the values already
+        """
+        reused = self.connected()
+        if not reused:
+            self.connect()
+        try:
+            self.sock.sendall(frame)
+            received = self.sock.recv(self.HEADER.size)
+            if not received:
+                raise ConnectionClosed('connection closed by {}:{}'.format(self.server, self.port))
+        except socket.timeout as ex:
+            self.close()
+            raise ZabbixTransportError('trapper {}:{}: {}'.format(self.server, self.port, ex))
+        except (socket.error, ConnectionClosed) as ex:
+            self.close()
+            if not reused:
+                raise ZabbixTransportError('trapper {}:{}: {}'.format(self.server, self.port, ex))
+            return self.exchange(frame)
+        try:
+            return self.receive(received)
+        except (socket.error, ConnectionClosed) as ex:
+            self.close()
+            raise ZabbixTransportError('trapper {}:{}: {}'.format(self.server, self.port, ex))
+
+    def send(self, values):
+
+        """
+        push (host, key, value) or (host, key, value, clock) tuples, batch_size per
+        frame, and return the totals of the answers: values processed and failed,
+        frames sent and seconds spent. values can be any iterable, only one batch is
+        held in memory at a time
+        """
+        totals = {'processed': 0, 'failed': 0, 'total': 0, 'batches': 0, 'seconds': 0.0}
+        started = time.time()
+        values = iter(values)
+        while True:
+            batch = list(islice(values, self.batch_size))
+            if not batch:
+                break
+            data = []
+            for value in batch:
+                entry = {'host': value[0], 'key': value[1], 'value': self.format_value(value[2])}
+                if len(value) > 3 and value[3] is not None:
+                    entry['clock'] = int(value[3])
+                data.append(entry)
+            answer = self.exchange(self.frame({'request': 'sender data', 'data': data, 'clock': int(time.time())}))
+            if answer.get('response') != 'success':
+                raise ZabbixSenderError('trapper {}:{} refused the values: {}'
+                                        .format(self.server, self.port, answer.get('info', answer)))
+            processed, failed = self.parse_info(answer.get('info'), len(batch))
+            totals['processed'] += processed
+            totals['failed'] += failed
+            totals['total'] += len(batch)
+            totals['batches'] += 1
+        totals['seconds'] = time.time() - started
+        return totals
+
+    @staticmethod
+    def format_value(value):
+
+        """
+        return value as the text the server parses: booleans as 1 or 0, integers
+        without the 'L' of longs, floats with all their digits (repr)
+        """
+        if isinstance(value, basestring):
+            return value
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        if isinstance(value, (int, long)):
+            return str(value)
+        if isinstance(value, float):
+            return repr(value)
+        return str(value)
+
+    @classmethod
+    def parse_info(cls, info, count):
+
+        """
+        return (processed, failed) from an answer info like
+        'processed: 998; failed: 2; total: 1000; seconds spent: 0.004'
+        """
+        match = cls.INFO.search(info or '')
+        if match is None:
+            # success without details, nothing was reported as failed
+            return count, 0
+        return int(match.group(1)), int(match.group(2))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
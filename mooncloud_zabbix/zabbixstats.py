@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+
+
+def bucket_label(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+class MethodStats(object):
+    """
+    counters of a single api method, latencies are kept as a cumulative
+    histogram so they can be exported as is to prometheus
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.calls = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.serialize = 0.0
+        self.network = 0.0
+        self.parse = 0.0
+
+    def record(self, latency, request_bytes, response_bytes, serialize, network, parse, error):
+        self.calls += 1
+        if error:
+            self.errors += 1
+        self.latency += latency
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.serialize += serialize
+        self.network += network
+        self.parse += parse
+        for index, bound in enumerate(self.buckets):
+            if latency <= bound:
+                self.bucket_counts[index] += 1
+
+    def to_dict(self):
+        return OrderedDict([
+            ('calls', self.calls),
+            ('errors', self.errors),
+            ('latency_seconds', self.latency),
+            ('latency_avg_seconds', self.latency / self.calls if self.calls else 0.0),
+            ('latency_histogram', OrderedDict((bucket_label(bound), count)
+                                              for bound, count in zip(self.buckets, self.bucket_counts))),
+            ('request_bytes', self.request_bytes),
+            ('response_bytes', self.response_bytes),
+            ('serialize_seconds', self.serialize),
+            ('network_seconds', self.network),
+            ('parse_seconds', self.parse),
+        ])
+
+
+class ApiStats(object):
+    """
+    per zabbix method instrumentation filled by ZabbixApi.call_api and by batches, one
+    entry per call they carry: call and error counts, latency histogram, request/response
+    sizes and the time spent encoding the request, waiting for the server and decoding
+    the answer
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.DEFAULT_BUCKETS)
+        self.methods = {}
+        self.lock = threading.Lock()
+
+    def record(self, method, latency, request_bytes=0, response_bytes=0, serialize=0.0, network=0.0, parse=0.0,
+               error=False):
+        with self.lock:
+            if method not in self.methods:
+                self.methods[method] = MethodStats(self.buckets)
+            self.methods[method].record(latency, request_bytes, response_bytes, serialize, network, parse, error)
+
+    def to_dict(self):
+        with self.lock:
+            return OrderedDict((method, self.methods[method].to_dict()) for method in sorted(self.methods))
+
+    def to_prometheus(self, prefix='zabbix_api'):
+        lines = []
+        counters = (('calls_total', 'calls', 'api calls sent'),
+                    ('errors_total', 'errors', 'api calls failed'),
+                    ('request_bytes_total', 'request_bytes', 'request body bytes sent'),
+                    ('response_bytes_total', 'response_bytes', 'response body bytes received'),
+                    ('serialize_seconds_total', 'serialize', 'time spent encoding requests'),
+                    ('network_seconds_total', 'network', 'time spent waiting for the server'),
+                    ('parse_seconds_total', 'parse', 'time spent decoding responses'))
+
+        with self.lock:
+            methods = sorted(self.methods.items())
+            for name, attribute, description in counters:
+                lines.append('# HELP {}_{} {}'.format(prefix, name, description))
+                lines.append('# TYPE {}_{} counter'.format(prefix, name))
+                for method, stats in methods:
+                    lines.append('{}_{}{{method="{}"}} {}'.format(prefix, name, method, getattr(stats, attribute)))
+
+            lines.append('# HELP {}_latency_seconds api call latency'.format(prefix))
+            lines.append('# TYPE {}_latency_seconds histogram'.format(prefix))
+            for method, stats in methods:
+                for bound, count in zip(stats.buckets, stats.bucket_counts):
+                    lines.append('{}_latency_seconds_bucket{{method="{}",le="{}"}} {}'.format(prefix, method,
+                                                                                          bucket_label(bound),
+                                                                                          count))
+                lines.append('{}_latency_seconds_sum{{method="{}"}} {}'.format(prefix, method, stats.latency))
+                lines.append('{}_latency_seconds_count{{method="{}"}} {}'.format(prefix, method, stats.calls))
+        return '\n'.join(lines) + '\n'
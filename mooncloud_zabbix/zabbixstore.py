@@ -0,0 +1,336 @@
+import os
+import time
+import mmap
+import calendar
+import fcntl
+import heapq
+import struct
+from itertools import izip
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DAY = 86400
+
+
+class MetricsStore(object):
+    """
+    local columnar copy of the collected values so recent data can be read without
+    asking zabbix. Every UTC day has its own segment made of three fixed width little
+    endian column files: DAY.itemid (u64), DAY.clock (u32) and DAY.value (f64).
+    Host and key names are kept once in a string table (length prefixed utf-8) and the
+    items catalogue maps every itemid to the indexes of its host and key names.
+    All files are append only. A segment holds as many rows as its shortest column, so
+    a flush interrupted by a crash loses its incomplete rows only, the next flush
+    truncates the longer columns first. A value is stored once per itemid and clock: the
+    writer reads the keys of a segment the first time it appends to that day, so exporting
+    the same values again adds nothing. Queries map the columns with mmap and decode
+    them in place, as numpy.frombuffer views when numpy is installed or block by block
+    with struct.unpack_from, a day is never loaded as python objects at once.
+    Only one process may write at a time, readers need no lock
+    """
+
+    COLUMNS = (('itemid', 'Q'), ('clock', 'I'), ('value', 'd'))
+    DTYPES = {'Q': '<u8', 'I': '<u4', 'd': '<f8'}
+    STRING_LENGTH = struct.Struct('<H')
+    CATALOGUE = struct.Struct('<QII')
+    BLOCK = 65536
+    FLUSH_ROWS = 100000
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self.strings = []
+        self.string_indexes = {}
+        self.items = {}
+        self.pending = {}
+        self.pending_strings = []
+        self.pending_items = []
+        self.pending_rows = 0
+        self.lock_file = None
+        # day -> set of itemid << 32 | clock stored or pending, for the days being written
+        self.stored_keys = {}
+        self.load()
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    # catalogue
+
+    def load(self):
+        self.strings = []
+        self.string_indexes = {}
+        self.items = {}
+        try:
+            with open(self.file('strings'), 'rb') as strings_file:
+                data = strings_file.read()
+        except IOError:
+            data = ''
+        offset = 0
+        while offset + self.STRING_LENGTH.size <= len(data):
+            length, = self.STRING_LENGTH.unpack_from(data, offset)
+            offset += self.STRING_LENGTH.size
+            if offset + length > len(data):
+                break
+            self.string_indexes[data[offset:offset + length].decode('utf-8')] = len(self.strings)
+            self.strings.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+
+        try:
+            with open(self.file('items'), 'rb') as items_file:
+                data = items_file.read()
+        except IOError:
+            data = ''
+        for offset in xrange(0, len(data) - len(data) % self.CATALOGUE.size, self.CATALOGUE.size):
+            itemid, host, key = self.CATALOGUE.unpack_from(data, offset)
+            # later records win, an item may have been renamed
+            if host < len(self.strings) and key < len(self.strings):
+                self.items[itemid] = (host, key)
+
+    def intern(self, name):
+        if not isinstance(name, unicode):
+            name = name.decode('utf-8')
+        index = self.string_indexes.get(name)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(name)
+            self.string_indexes[name] = index
+            self.pending_strings.append(name)
+        return index
+
+    def name(self, itemid):
+        host, key = self.items[itemid]
+        return self.strings[host], self.strings[key]
+
+    def select(self, itemids=None, host=None, key=None):
+
+        """
+        return the set of stored itemids matching every given filter,
+        None when no filter is given
+        """
+        if itemids is None and host is None and key is None:
+            return None
+        selected = set(int(itemid) for itemid in itemids) if itemids is not None else set(self.items)
+        selected &= set(self.items)
+        for position, name in enumerate((host, key)):
+            if name is None:
+                continue
+            if not isinstance(name, unicode):
+                name = name.decode('utf-8')
+            index = self.string_indexes.get(name)
+            selected = set(itemid for itemid in selected if self.items[itemid][position] == index)
+        return selected
+
+    # writing
+
+    def append(self, host, key, itemid, clock, value):
+
+        """
+        queue a value, non numeric values and values whose itemid and clock are
+        already stored are ignored and False is returned. Values are written by
+        flush, called automatically every FLUSH_ROWS values
+        """
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        if self.lock_file is None:
+            # names are numbered by this process from now on, start from the current files
+            self.acquire()
+            self.load()
+        itemid = int(itemid)
+        clock = int(clock)
+        keys = self.stored_keys.get(clock // DAY)
+        if keys is None:
+            keys = self.stored_keys[clock // DAY] = self.keys(clock // DAY)
+        if (itemid << 32 | clock) in keys:
+            return False
+        keys.add(itemid << 32 | clock)
+        names = (self.intern(host), self.intern(key))
+        if self.items.get(itemid) != names:
+            self.items[itemid] = names
+            self.pending_items.append((itemid, names))
+        rows = self.pending.setdefault(clock // DAY, ([], [], []))
+        rows[0].append(itemid)
+        rows[1].append(clock)
+        rows[2].append(value)
+        self.pending_rows += 1
+        if self.pending_rows >= self.FLUSH_ROWS:
+            self.flush()
+        return True
+
+    def flush(self):
+        if not (self.pending or self.pending_strings or self.pending_items):
+            return
+        self.acquire()
+        # names first: a catalogue record must never point past the string table
+        if self.pending_strings:
+            with open(self.file('strings'), 'ab') as strings_file:
+                for name in self.pending_strings:
+                    encoded = name.encode('utf-8')
+                    strings_file.write(self.STRING_LENGTH.pack(len(encoded)) + encoded)
+        if self.pending_items:
+            with open(self.file('items'), 'ab') as items_file:
+                items_file.write(''.join(self.CATALOGUE.pack(itemid, host, key)
+                                         for itemid, (host, key) in self.pending_items))
+        for day, columns in sorted(self.pending.items()):
+            self.repair(day)
+            for (name, code), values in zip(self.COLUMNS, columns):
+                with open(self.segment(day, name), 'ab') as column_file:
+                    column_file.write(struct.pack('<{}{}'.format(len(values), code), *values))
+        # keep the keys of the days still being written only, the others are read again if needed
+        self.stored_keys = dict((day, keys) for day, keys in self.stored_keys.items() if day in self.pending)
+        self.pending = {}
+        self.pending_strings = []
+        self.pending_items = []
+        self.pending_rows = 0
+
+    def repair(self, day):
+        rows = self.rows(day)
+        for name, code in self.COLUMNS:
+            path = self.segment(day, name)
+            if os.path.exists(path) and os.path.getsize(path) != rows * struct.calcsize('<' + code):
+                with open(path, 'r+b') as column_file:
+                    column_file.truncate(rows * struct.calcsize('<' + code))
+        return rows
+
+    def acquire(self):
+        if self.lock_file is not None:
+            return
+        lock_file = open(self.file('writer.lock'), 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            lock_file.close()
+            raise IOError('metrics store {} is being written by another process'.format(self.path))
+        self.lock_file = lock_file
+
+    def close(self):
+        self.flush()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    # reading
+
+    def segment(self, day, name):
+        return self.file('{}.{}'.format(time.strftime('%Y%m%d', time.gmtime(day * DAY)), name))
+
+    def days(self):
+        days = set()
+        for name in os.listdir(self.path):
+            if name.endswith('.itemid') and name[:8].isdigit():
+                days.add(calendar.timegm(time.strptime(name[:8], '%Y%m%d')) // DAY)
+        return sorted(days)
+
+    def rows(self, day):
+        counts = []
+        for name, code in self.COLUMNS:
+            path = self.segment(day, name)
+            counts.append(os.path.getsize(path) // struct.calcsize('<' + code) if os.path.exists(path) else 0)
+        return min(counts)
+
+    def blocks(self, day, reverse=False):
+
+        """
+        yield (itemids, clocks, values) blocks of up to BLOCK rows of a segment
+        decoded straight from the mapped columns. numpy blocks are views on the
+        maps, they must not be used once the next block is requested
+        """
+        rows = self.rows(day)
+        if not rows:
+            return
+        files = [open(self.segment(day, name), 'rb') for name, code in self.COLUMNS]
+        maps = []
+        try:
+            for column_file in files:
+                maps.append(mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ))
+            starts = range(0, rows, self.BLOCK)
+            for start in reversed(starts) if reverse else starts:
+                count = min(self.BLOCK, rows - start)
+                block = []
+                for mapped, (name, code) in zip(maps, self.COLUMNS):
+                    width = struct.calcsize('<' + code)
+                    if numpy is not None:
+                        block.append(numpy.frombuffer(mapped, dtype=self.DTYPES[code], count=count,
+                                                      offset=start * width))
+                    else:
+                        block.append(struct.unpack_from('<{}{}'.format(count, code), mapped, start * width))
+                yield block
+                del block
+        finally:
+            for mapped in maps:
+                mapped.close()
+            for column_file in files:
+                column_file.close()
+
+    def keys(self, day):
+
+        """
+        return the set of itemid << 32 | clock of the values stored in a segment
+        """
+        keys = set()
+        for itemid_column, clock_column, value_column in self.blocks(day):
+            if numpy is not None:
+                itemid_column, clock_column = itemid_column.tolist(), clock_column.tolist()
+            keys.update(itemid << 32 | clock for itemid, clock in izip(itemid_column, clock_column))
+        return keys
+
+    def range(self, time_from, time_till, itemids=None, host=None, key=None):
+
+        """
+        yield (host, key, itemid, clock, value) of the stored values between
+        time_from and time_till (both included) of the selected items
+        """
+        selected = self.select(itemids, host, key)
+        if selected is not None and not selected:
+            return
+        first, last = int(time_from) // DAY, int(time_till) // DAY
+        for day in self.days():
+            if not first <= day <= last:
+                continue
+            for itemid_column, clock_column, value_column in self.blocks(day):
+                for itemid, clock, value in self.matching(itemid_column, clock_column, value_column, selected,
+                                                          time_from, time_till):
+                    host_name, key_name = self.name(itemid)
+                    yield host_name, key_name, itemid, clock, value
+
+    def last(self, count=1, itemids=None, host=None, key=None):
+
+        """
+        return {itemid: [(clock, value), ...]} with the count most recent values of
+        every selected item, newest first. Segments are read from the newest and older
+        days are skipped once every selected item has count values. A clock stored more
+        than once (by a store written before values were deduplicated) counts once
+        """
+        selected = self.select(itemids, host, key)
+        wanted = set(self.items) if selected is None else selected
+        newest = {}
+        for day in reversed(self.days()):
+            if all(len(newest.get(itemid, ())) >= count for itemid in wanted):
+                break
+            for itemid_column, clock_column, value_column in self.blocks(day, reverse=True):
+                for itemid, clock, value in self.matching(itemid_column, clock_column, value_column, selected):
+                    values = newest.setdefault(itemid, [])
+                    if any(stored == clock for stored, stored_value in values):
+                        continue
+                    if len(values) < count:
+                        heapq.heappush(values, (clock, value))
+                    elif clock > values[0][0]:
+                        heapq.heapreplace(values, (clock, value))
+        return dict((itemid, sorted(values, reverse=True)) for itemid, values in newest.items())
+
+    @staticmethod
+    def matching(itemid_column, clock_column, value_column, selected, time_from=None, time_till=None):
+        if numpy is not None:
+            mask = numpy.ones(len(itemid_column), dtype=bool)
+            if selected is not None:
+                mask &= numpy.in1d(itemid_column, numpy.fromiter(selected, dtype=numpy.uint64, count=len(selected)))
+            if time_from is not None:
+                mask &= (clock_column >= int(time_from)) & (clock_column <= int(time_till))
+            return izip(itemid_column[mask].tolist(), clock_column[mask].tolist(), value_column[mask].tolist())
+        return ((itemid, clock, value) for itemid, clock, value in izip(itemid_column, clock_column, value_column)
+                if (selected is None or itemid in selected) and
+                (time_from is None or time_from <= clock <= time_till))
@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+class TokenCache(object):
+    """
+    keep zabbix auth tokens between runs so every invocation does not need a new
+    user.login. Tokens are stored in a json file readable only by its owner and keyed
+    by a hash of url and username. A cached token is checked with a cheap api call
+    before it is reused: if the server rejects it the api falls back to a real login
+    and the new token replaces it.
+    Tokens older than max_age seconds (when set) are never reused
+    """
+    def __init__(self, path, max_age=None):
+        self.path = os.path.expanduser(path)
+        self.max_age = max_age
+
+    @staticmethod
+    def key(url, username):
+        return hashlib.sha256(u'{}\0{}'.format(url, username).encode('utf-8')).hexdigest()
+
+    def load(self):
+        try:
+            with open(self.path) as cache_file:
+                tokens = json.load(cache_file)
+        except (IOError, ValueError):
+            return {}
+        if not isinstance(tokens, dict):
+            return {}
+        return tokens
+
+    def save(self, tokens):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        # mkstemp creates the file with 0600 permissions
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tokens')
+        try:
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump(tokens, cache_file)
+            os.rename(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def get(self, url, username):
+        entry = self.load().get(self.key(url, username))
+        if entry is None:
+            return None
+        if self.max_age is not None and time.time() - entry.get('created', 0) > self.max_age:
+            return None
+        return entry.get('token')
+
+    def put(self, url, username, token):
+        tokens = self.load()
+        tokens[self.key(url, username)] = {'token': token, 'created': int(time.time())}
+        self.save(tokens)
+
+    def delete(self, url, username):
+        tokens = self.load()
+        if tokens.pop(self.key(url, username), None) is not None:
+            self.save(tokens)
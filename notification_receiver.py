@@ -1,15 +1,162 @@
 #!/usr/bin/env python
 # # -*- coding: utf-8 -*-
 
+import os
+import sys
+import json
+import time
+import Queue
+import argparse
+import threading
 from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class NotificationQueue(object):
+    """
+    bounded in-memory queue of notifications backed by an append-only spool file.
+    A message is written to the spool before being queued so nothing acknowledged is
+    lost on restart: the offset of the last processed message is kept next to the spool
+    and everything after it is replayed at startup. Once every spooled message is
+    processed the spool is truncated
+    """
+    def __init__(self, spool_path, max_size=10000):
+        self.spool_path = spool_path
+        self.offset_path = spool_path + '.offset'
+        self.queue = Queue.Queue(max_size)
+        self.lock = threading.Lock()
+        self.spool = open(spool_path, 'a')
+        self.spool.seek(0, os.SEEK_END)
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.batches = 0
+        self.started = time.time()
+
+    def put(self, notifications):
+
+        """
+        spool and queue a list of notifications, either all of them or none
+        when the queue has no room left: return False in that case
+        """
+        with self.lock:
+            if self.queue.maxsize - self.queue.qsize() < len(notifications):
+                self.rejected += len(notifications)
+                return False
+            for notification in notifications:
+                self.spool.write(json.dumps(notification) + '\n')
+                self.spool.flush()
+                self.queue.put_nowait((notification, self.spool.tell()))
+                self.received += 1
+        return True
+
+    def replay(self):
+
+        """
+        queue again the messages spooled but not processed before the last stop
+        """
+        offset = self.read_offset()
+        replayed = 0
+        with open(self.spool_path) as spool:
+            spool.seek(offset)
+            while True:
+                line = spool.readline()
+                if not line.endswith('\n'):
+                    break
+                try:
+                    notification = json.loads(line)
+                except ValueError:
+                    continue
+                # blocking put, the worker is already draining the queue
+                self.queue.put((notification, spool.tell()))
+                replayed += 1
+        return replayed
+
+    def get_batch(self, batch_size, wait):
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=wait))
+            while len(batch) < batch_size:
+                batch.append(self.queue.get_nowait())
+        except Queue.Empty:
+            pass
+        return batch
+
+    def commit(self, batch):
+        if not batch:
+            return
+        with self.lock:
+            self.processed += len(batch)
+            self.batches += 1
+            offset = batch[-1][1]
+            if self.queue.empty() and offset == self.spool.tell():
+                # everything spooled has been processed, start over
+                self.spool.truncate(0)
+                self.spool.seek(0)
+                offset = 0
+            self.write_offset(offset)
+
+    def read_offset(self):
+        try:
+            with open(self.offset_path) as offset_file:
+                return int(offset_file.read() or 0)
+        except (IOError, ValueError):
+            return 0
+
+    def write_offset(self, offset):
+        tmp_path = self.offset_path + '.tmp'
+        with open(tmp_path, 'w') as offset_file:
+            offset_file.write(str(offset))
+        os.rename(tmp_path, self.offset_path)
+
+    def stats(self):
+        elapsed = time.time() - self.started
+        return {'received': self.received,
+                'processed': self.processed,
+                'rejected': self.rejected,
+                'batches': self.batches,
+                'queue_depth': self.queue.qsize(),
+                'uptime': elapsed,
+                'processed_per_second': self.processed / elapsed if elapsed else 0.0}
+
+
+class NotificationWorker(threading.Thread):
+    """
+    background thread taking notifications from the queue in batches
+    """
+    def __init__(self, notifications, batch_size=100, wait=1.0):
+        super(NotificationWorker, self).__init__()
+        self.daemon = True
+        self.notifications = notifications
+        self.batch_size = batch_size
+        self.wait = wait
+
+    def run(self):
+        while True:
+            batch = self.notifications.get_batch(self.batch_size, self.wait)
+            if batch:
+                self.process([notification for notification, offset in batch])
+                self.notifications.commit(batch)
+
+    def process(self, batch):
+        for notification in batch:
+            print(u'{}: {}'.format(notification.get('subject'), notification.get('message')).encode('utf-8'))
+        sys.stdout.flush()
+
 
 class S(BaseHTTPRequestHandler):
-    def _set_headers(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+    notifications = None
+
+    def _set_headers(self, code=200, content_type='text/html'):
+        self.send_response(code)
+        self.send_header('Content-type', content_type)
         self.end_headers()
 
     def do_GET(self):
+        if self.path == '/stats':
+            self._set_headers(content_type='application/json')
+            self.wfile.write(json.dumps(self.notifications.stats()))
+            return
         self._set_headers()
         self.wfile.write("<html><body><h1>GET</h1></body></html>")
 
@@ -17,16 +164,50 @@ class S(BaseHTTPRequestHandler):
         self._set_headers()
 
     def do_POST(self):
-        # Doesn't do anything with posted data
-        self._set_headers()
-        self.wfile.write("<html><body><h1>POST</h1></body></html>")
-        content_length = int(self.headers['Content-Length'])
-        print content_length
+        content_length = int(self.headers.get('Content-Length', 0))
         post_data = self.rfile.read(content_length)
-        print post_data
+        try:
+            notifications = json.loads(post_data)
+        except ValueError:
+            self._set_headers(400)
+            self.wfile.write("<html><body><h1>invalid json</h1></body></html>")
+            return
+        if not isinstance(notifications, list):
+            notifications = [notifications]
+
+        for notification in notifications:
+            if not isinstance(notification, dict) or 'subject' not in notification or 'message' not in notification:
+                self._set_headers(400)
+                self.wfile.write("<html><body><h1>subject and message required</h1></body></html>")
+                return
+
+        if not self.notifications.put(notifications):
+            self._set_headers(503)
+            self.wfile.write("<html><body><h1>queue full</h1></body></html>")
+            return
+
+        self._set_headers(202)
+        self.wfile.write("<html><body><h1>POST</h1></body></html>")
+
+    def log_message(self, format, *args):
+        # one access log line per alert would slow down every request
+        pass
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
 
+def run(server_class=ThreadedHTTPServer, handler_class=S, port=8000, spool='notification_spool.log',
+        queue_size=10000, batch_size=100):
+    notifications = NotificationQueue(spool, max_size=queue_size)
+    worker = NotificationWorker(notifications, batch_size=batch_size)
+    worker.start()
+    replayed = notifications.replay()
+    if replayed:
+        print 'Replayed {} spooled notifications'.format(replayed)
 
-def run(server_class=HTTPServer, handler_class=S, port=8000):
+    handler_class.notifications = notifications
     server_address = ('', port)
     httpd = server_class(server_address, handler_class)
     print 'Starting httpd...'
@@ -34,9 +215,14 @@ def run(server_class=HTTPServer, handler_class=S, port=8000):
 
 
 if __name__ == "__main__":
-    from sys import argv
+    parser = argparse.ArgumentParser(description="Receive Zabbix notifications sent by alert_script.sh")
+    parser.add_argument("port", nargs='?', type=int, default=8000, help="listening port")
+    parser.add_argument("--spool", type=str, default='notification_spool.log',
+                        help="append-only file keeping notifications until processed")
+    parser.add_argument("--queue-size", type=int, default=10000, dest='queuesize',
+                        help="max notifications waiting to be processed")
+    parser.add_argument("--batch-size", type=int, default=100, dest='batchsize',
+                        help="notifications processed together")
+    args = parser.parse_args()
 
-    if len(argv) == 2:
-        run(port=int(argv[1]))
-    else:
-        run()
+    run(port=args.port, spool=args.spool, queue_size=args.queuesize, batch_size=args.batchsize)